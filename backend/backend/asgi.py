@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if settings.RAG_WARMUP:
+    from rag.registry import warmup
+    warmup()
@@ -1,8 +1,19 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')  # replace with your settings
 
 app = Celery('backend')
 app.config_from_object('django.conf:settings', namespace='CELERY')
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+
+# Runs in each pool process after the fork, so no model state is shared
+# across fork boundaries
+@worker_process_init.connect
+def warmup_rag(**kwargs):
+    from django.conf import settings
+    if settings.RAG_WARMUP:
+        from rag.registry import warmup
+        warmup()
@@ -147,4 +147,27 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True
 
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
\ No newline at end of file
+CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+
+# 'shared' is shared between web and Celery processes, in the Redis the
+# Celery broker already uses: the distributed crawl's seen-URL set,
+# RAG_EXPANSION_CACHE=shared and answer-cache invalidation. Nothing else
+# needs Redis, so 'default' stays local to the process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    },
+}
+
+# Load the embedding model and Chroma client when a web or Celery worker
+# process starts, instead of on its first chat request or crawl
+RAG_WARMUP = False
+
+# Crawl new bots with user.tasks.crawl_site, spread over every Celery worker,
+# instead of one resumable crawl_and_embed task. Near-duplicate filtering
+# and per-host politeness then only apply within each worker's batch.
+RAG_DISTRIBUTED_CRAWL = False
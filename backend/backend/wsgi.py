@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.RAG_WARMUP:
+    from rag.registry import warmup
+    warmup()
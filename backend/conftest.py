@@ -0,0 +1,152 @@
+import gzip
+import random
+import string
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOCAB_WORDS = "the shipping order return refund account price book store delivery customer support".split()
+
+
+class Routes(dict):
+    """{path: (status, headers, body)}, plus a log of the requests served."""
+    def __init__(self):
+        super().__init__()
+        self.latency = 0.0  # seconds each response takes
+        self.requests = []  # (path, started, finished)
+        self.lock = threading.Lock()
+
+    def paths(self) -> list:
+        with self.lock:
+            return [path for path, _, _ in self.requests]
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    routes = Routes()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        started = time.monotonic()
+        try:
+            self._respond()
+        finally:
+            with self.routes.lock:
+                self.routes.requests.append((self.path, started, time.monotonic()))
+
+    def _respond(self):
+        if self.routes.latency:
+            time.sleep(self.routes.latency)
+        route = self.routes.get(self.path)
+        if route is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status, headers, body = route
+        if isinstance(body, str):
+            body = body.encode()
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.compress(body)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def site():
+    """
+    Serves `routes` ({path: (status, headers, body)}) on a local port.
+    Returns (base_url, routes) so tests can register pages and inspect
+    routes.requests.
+    """
+    routes = Routes()
+    handler = type("Handler", (SiteHandler,), {"routes": routes})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", routes
+    server.shutdown()
+    server.server_close()
+
+
+def page_html(title, *links):
+    """A page headed `title` linking to `links`. Its 60 words are drawn from
+    VOCAB_WORDS seeded by the title, so no two pages are near-duplicates."""
+    words = " ".join(random.Random(title).choices(VOCAB_WORDS, k=60))
+    anchors = "".join(f'<a href="{link}">{link}</a>' for link in links)
+    return f"<html><body><h1>{title}</h1><p>{title} {words}</p>{anchors}</body></html>"
+
+
+def add_site_tree(routes, children=8, grandchildren=2):
+    """/ links to /p0.. which each link to /p0/c0.."""
+    headers = {"Content-Type": "text/html"}
+    routes["/"] = (200, headers, page_html("Home", *[f"/p{n}" for n in range(children)]))
+    for n in range(children):
+        routes[f"/p{n}"] = (200, headers, page_html(f"Page {n}", *[f"/p{n}/c{m}" for m in range(grandchildren)]))
+        for m in range(grandchildren):
+            routes[f"/p{n}/c{m}"] = (200, headers, page_html(f"Child {n} {m}"))
+
+
+@pytest.fixture
+def html():
+    """page_html(title, *links), the body of a page for `site`."""
+    return page_html
+
+
+@pytest.fixture
+def add_tree():
+    """add_site_tree(routes, children=8, grandchildren=2), a two-level site for `site`."""
+    return add_site_tree
+
+
+class HashEmbedder:
+    """Three-dimensional vectors from each text's hash; records every text it embeds."""
+    name = "hash"
+    model_id = "hash/v1"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        import numpy as np
+        self.embedded += texts
+        return np.array([[hash(text) % 997, len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def hash_embedder(monkeypatch):
+    """Ingest embeds with a HashEmbedder instead of a model."""
+    from rag import embeddings
+    embedder = HashEmbedder()
+    monkeypatch.setattr(embeddings, "ingest_embedder", lambda: embedder)
+    return embedder
+
+
+@pytest.fixture
+def tokenizer(tmp_path, monkeypatch):
+    """The tokenizer rag.embeddings chunks with, over a small WordPiece vocabulary so no model is downloaded."""
+    from transformers import BertTokenizerFast
+    from rag import embeddings
+    pieces = [c for c in string.ascii_lowercase + string.digits + string.punctuation]
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + VOCAB_WORDS + pieces + ["##" + c for c in pieces]
+    (tmp_path / "vocab.txt").write_text("\n".join(vocab))
+    tok = BertTokenizerFast(vocab_file=str(tmp_path / "vocab.txt"))
+    monkeypatch.setattr(embeddings, "_tokenizer", tok)
+    monkeypatch.setattr(embeddings, "_offsets_tokenizer", embeddings._untruncated(tok.backend_tokenizer))
+    return tok
+
+
+@pytest.fixture(autouse=True)
+def vector_index_path(tmp_path, monkeypatch):
+    """Keeps NumPy indexes built by ingest tests out of the working tree."""
+    from rag import registry
+    path = str(tmp_path / "vector_index")
+    monkeypatch.setattr(registry, "VECTOR_INDEX_PATH", path)
+    return path
@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+import numpy as np
+
+# -------------------------------
+# Semantic answer cache
+# -------------------------------
+class _BotAnswers:
+    def __init__(self, version):
+        self.version = version
+        self.vectors = None  # (n, dim), one row per cached question
+        self.answers = []    # (answer, is_resolved, expires at)
+
+class SemanticAnswerCache:
+    """
+    Answers a bot already gave, looked up by question embedding: a new
+    question whose cosine similarity to a cached one is at least
+    `threshold` gets the cached answer, so paraphrases ("what are your
+    hours", "when are you open") skip retrieval and generation.
+
+    Entries live in the process, at most `max_entries` per bot (oldest
+    dropped first) and each for `ttl` seconds. invalidate() bumps the bot's
+    version in `versions`, a Django-style cache shared by every web and
+    Celery worker, so a re-ingest in a worker clears the answers web
+    processes hold. Without `versions` the version is local to the process.
+    Question vectors must be L2-normalised, as every embedder's are.
+
+    The cache never makes chat depend on `versions`: it is read before the
+    lock is taken, and while it can't be reached lookups miss, answers
+    aren't stored and invalidate() only clears this process.
+    """
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: float = 24 * 3600,
+                 versions=None, prefix: str = 'rag:answers'):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.versions = versions
+        self.prefix = prefix
+        self._bots = {}
+        self._local_versions = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.invalidations = 0
+
+    def _version(self, scope):
+        # None when the shared versions can't be read
+        if self.versions is None:
+            return self._local_versions.get(scope, 0)
+        try:
+            return self.versions.get(f"{self.prefix}:{scope}:version", 0)
+        except Exception as e:
+            logging.warning(f"Answer cache versions unavailable, not using cached answers: {e}")
+            return None
+
+    def _answers(self, scope, version) -> _BotAnswers:
+        bot = self._bots.get(scope)
+        if bot is None or bot.version != version:
+            bot = self._bots[scope] = _BotAnswers(version)
+        return bot
+
+    def lookup(self, scope, vector: np.ndarray):
+        """(answer, is_resolved) cached for a question close enough to this one, or None."""
+        vector = np.asarray(vector, dtype=np.float32)
+        version = self._version(scope)
+        with self._lock:
+            if version is None:
+                self.misses += 1
+                return None
+            bot = self._answers(scope, version)
+            if bot.vectors is not None:
+                similarities = bot.vectors @ vector
+                # Expired entries can't match; they are replaced as new answers come in
+                similarities[[expires <= time.monotonic() for _, _, expires in bot.answers]] = -1
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    answer, is_resolved, _ = bot.answers[best]
+                    return answer, is_resolved
+            self.misses += 1
+            return None
+
+    def store(self, scope, vector: np.ndarray, answer: str, is_resolved: bool):
+        vector = np.asarray(vector, dtype=np.float32)[None, :]
+        version = self._version(scope)
+        if version is None:
+            return
+        with self._lock:
+            bot = self._answers(scope, version)
+            entry = (answer, is_resolved, time.monotonic() + self.ttl)
+            if bot.vectors is None:
+                bot.vectors, bot.answers = vector, [entry]
+                return
+            live = [n for n, (_, _, expires) in enumerate(bot.answers) if expires > time.monotonic()]
+            keep = live[-(self.max_entries - 1):] if self.max_entries > 1 else []
+            bot.vectors = np.concatenate([bot.vectors[keep], vector])
+            bot.answers = [bot.answers[n] for n in keep] + [entry]
+
+    def invalidate(self, scope):
+        """Forget every answer cached for this bot, in all processes."""
+        if self.versions is not None:
+            key = f"{self.prefix}:{scope}:version"
+            try:
+                self.versions.add(key, 0, timeout=None)
+                self.versions.incr(key)
+            except Exception as e:
+                logging.warning(f"Could not invalidate cached answers of {scope} in other processes: {e}")
+        with self._lock:
+            if self.versions is None:
+                self._local_versions[scope] = self._local_versions.get(scope, 0) + 1
+            self._bots.pop(scope, None)
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'bots': len(self._bots),
+            'entries': sum(len(bot.answers) for bot in self._bots.values()),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+        }
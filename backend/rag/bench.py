@@ -0,0 +1,151 @@
+"""
+Micro-benchmarks for the RAG pipeline.
+
+    python -m rag.bench extraction [--pages N] [FILE.html ...]
+    python -m rag.bench embeddings [--chunks N] [--queries N] [BACKEND ...]
+"""
+import argparse
+import random
+import time
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+
+import numpy as np
+from .embedders import BACKENDS as EMBEDDING_BACKENDS
+from .extraction import BACKENDS, extract, extract_page_text
+
+# -------------------------------
+# Synthetic pages
+# -------------------------------
+WORDS = (
+    "shipping order return refund account price book store delivery "
+    "customer support product page guide help payment card stock size"
+).split()
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 20))]
+    return ' '.join(words).capitalize() + '.'
+
+def synthetic_page(rng: random.Random) -> str:
+    """A docs/e-commerce style page: heavy nav and footer around the content."""
+    nav = ''.join(f'<li><a href="/category/{i}">{rng.choice(WORDS)}</a></li>' for i in range(60))
+    sections = []
+    for h in range(rng.randint(4, 10)):
+        paragraphs = ''.join(
+            f'<p>{_sentence(rng)} <a href="/item/{rng.randint(0, 999)}">{rng.choice(WORDS)}</a> {_sentence(rng)}</p>'
+            for _ in range(rng.randint(2, 6))
+        )
+        items = ''.join(f'<li>{_sentence(rng)}</li>' for _ in range(rng.randint(0, 5)))
+        sections.append(f'<h2>Section {h}</h2><div class="content">{paragraphs}<ul>{items}</ul></div>')
+    footer = ''.join(f'<a href="/legal/{i}">{rng.choice(WORDS)}</a>' for i in range(25))
+    return (
+        '<!DOCTYPE html><html><head><title>Page</title><style>body{margin:0}</style>'
+        '<script>window.dataLayer=[];</script></head><body>'
+        f'<header><h1>Store</h1></header><nav><ul>{nav}</ul></nav>'
+        f'<main><article>{"".join(sections)}</article></main>'
+        f'<aside>{_sentence(rng)}</aside><footer>{footer}</footer></body></html>'
+    )
+
+# -------------------------------
+# Extraction benchmark
+# -------------------------------
+def legacy_extract(html: str, base_url: str) -> dict:
+    # What crawl() did before the extraction backends: html.parser, a
+    # decompose pass, get_text, then a second find_all('a') walk.
+    soup = BeautifulSoup(html, 'html.parser')
+    text = extract_page_text(soup)
+    links = [urljoin(base_url, link['href']) for link in soup.find_all('a', href=True)]
+    return {'text': text, 'links': links}
+
+def _text_and_links(page: dict) -> dict:
+    return {'text': page['text'], 'links': page['links']}
+
+def bench_extraction(pages: list, base_url: str = 'https://example.com/'):
+    candidates = {'legacy (html.parser, two passes)': legacy_extract}
+    for name in BACKENDS:
+        candidates[name] = lambda html, url, name=name: _text_and_links(extract(html, url, backend=name))
+
+    expected = [legacy_extract(html, base_url) for html in pages]
+    for label, fn in candidates.items():
+        start = time.perf_counter()
+        outputs = [fn(html, base_url) for html in pages]
+        elapsed = time.perf_counter() - start
+        same = sum(out == exp for out, exp in zip(outputs, expected))
+        print(f"{label:<36} {len(pages) / elapsed:8.1f} pages/s   identical output: {same}/{len(pages)}")
+
+# -------------------------------
+# Embedding benchmark
+# -------------------------------
+def synthetic_chunk(rng: random.Random) -> str:
+    """About the 400 tokens the chunker aims for."""
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(15, 25)))
+
+def bench_embeddings(chunks: list, queries: list, backends: list, batch_size: int = 500):
+    """
+    Ingest throughput (chunks/s in add-sized batches), single-query latency,
+    and cosine similarity to the first backend's vectors, which is what
+    decides whether a backend can serve an existing collection.
+    """
+    from .registry import get_embedder
+    reference = None
+    for name in backends:
+        embedder = get_embedder(name)
+        try:
+            start = time.perf_counter()
+            embedder.embed(queries[:1])  # model load, quantization, first-run setup
+            load = time.perf_counter() - start
+        except Exception as e:
+            print(f"{name:<24} unavailable: {e}")
+            continue
+
+        start = time.perf_counter()
+        vectors = np.concatenate([embedder.embed(chunks[i:i + batch_size]) for i in range(0, len(chunks), batch_size)])
+        throughput = len(chunks) / (time.perf_counter() - start)
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            embedder.embed([query])
+            latencies.append((time.perf_counter() - start) * 1000)
+        p50, p95 = np.percentile(latencies, [50, 95])
+
+        if reference is None:
+            reference, agreement = (name, vectors), 'reference'
+        else:
+            similarity = (reference[1] * vectors).sum(axis=1)
+            agreement = f"cosine to {reference[0]}: min {similarity.min():.4f} mean {similarity.mean():.4f}"
+        print(
+            f"{name:<24} load {load:6.2f}s  {throughput:8.1f} chunks/s  "
+            f"query p50 {p50:6.1f}ms p95 {p95:6.1f}ms  {agreement}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    extraction = sub.add_parser('extraction', help='pages/sec of each HTML extraction backend')
+    extraction.add_argument('files', nargs='*', help='HTML files to use instead of synthetic pages')
+    extraction.add_argument('--pages', type=int, default=200)
+    embeddings = sub.add_parser('embeddings', help='throughput and latency of each embedding backend')
+    embeddings.add_argument('backends', nargs='*', default=list(EMBEDDING_BACKENDS), help='backends to compare, first is the reference')
+    embeddings.add_argument('--chunks', type=int, default=1000)
+    embeddings.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'extraction':
+        if args.files:
+            pages = []
+            for path in args.files:
+                with open(path, encoding='utf-8', errors='replace') as f:
+                    pages.append(f.read())
+        else:
+            rng = random.Random(0)
+            pages = [synthetic_page(rng) for _ in range(args.pages)]
+        bench_extraction(pages)
+    elif args.command == 'embeddings':
+        rng = random.Random(0)
+        chunks = [synthetic_chunk(rng) for _ in range(args.chunks)]
+        queries = [_sentence(rng) for _ in range(args.queries)]
+        bench_embeddings(chunks, queries, args.backends)
+
+if __name__ == '__main__':
+    main()
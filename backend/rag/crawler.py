@@ -1,12 +1,20 @@
-import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, urlunparse
-from collections import deque
+from urllib.parse import urlparse, urlunparse
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import queue
+import threading
 import csv
-import time
 import logging
 from functools import lru_cache
 from .embeddings import count_tokens  # Use centralized tokenizer
+from .fetcher import Fetcher
+from .frontier import Frontier
+from .dedup import page_text, simhash
+from .extraction import extract, walk_bs4, PageCollector
+from .sitemap import load_site_hints, ROBOTS_AGENT
+from requests import HTTPError
 
 # -------------------------------
 # Setup logging
@@ -27,124 +35,584 @@ def normalize_url(url: str) -> str:
 # -------------------------------
 # Extract sections from HTML
 # -------------------------------
+def has_min_tokens(text: str, min_tokens: int) -> bool:
+    # Every whitespace-separated word is at least one WordPiece token, so
+    # the tokenizer is only needed when the word count falls short.
+    if len(text.split()) >= min_tokens:
+        return True
+    return count_tokens(text) >= min_tokens
+
+def merge_short_sections(sections: list, min_tokens: int = 50) -> list:
+    """
+    Fold sections with fewer than `min_tokens` tokens into the section before
+    them (or the next one, at the top of the page) so no text is dropped.
+    A page whose text is short overall still yields one section.
+    """
+    merged = []
+    pending = []  # short sections seen before the first long one
+    for section in sections:
+        if has_min_tokens(section['text'], min_tokens):
+            section = dict(section)
+            if pending:
+                section['text'] = ' '.join(pending + [section['text']])
+                pending = []
+            merged.append(section)
+            continue
+        parts = [section['text']] if not section['h_level'] else [section['section_title'], section['text']]
+        text = ' '.join(p for p in parts if p)
+        if not text:
+            continue
+        if merged:
+            merged[-1]['text'] = f"{merged[-1]['text']} {text}"
+        else:
+            pending.append(text)
+            logging.debug(f"Section '{section['section_title']}' merged forward (under {min_tokens} tokens)")
+
+    if pending:
+        merged.append({
+            'section_title': sections[0]['section_title'],
+            'h_level': sections[0]['h_level'],
+            'text': ' '.join(pending)
+        })
+    return merged
+
 def extract_sections(soup: BeautifulSoup, min_tokens: int = 50):
-    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-        tag.decompose()
+    collector = walk_bs4(soup, PageCollector())
+    return merge_short_sections(collector.result('')['sections'], min_tokens)
+
+# -------------------------------
+# Change detection helpers
+# -------------------------------
+GONE_STATUSES = (404, 410)
+
+def content_hash(records: list) -> str:
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update(record['section_title'].encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(record['text'].encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def conditional_headers(previous: dict) -> dict:
+    headers = {}
+    if previous.get('etag'):
+        headers['If-None-Match'] = previous['etag']
+    if previous.get('last_modified'):
+        headers['If-Modified-Since'] = previous['last_modified']
+    return headers
+
+def unchanged_page(url: str, previous: dict) -> dict:
+    return {
+        'url': url,
+        'changed': False,
+        'records': [],
+        'links': previous.get('links', []),
+        'etag': previous.get('etag', ''),
+        'last_modified': previous.get('last_modified', ''),
+        'content_hash': previous.get('content_hash', ''),
+        'simhash': previous.get('simhash')
+    }
+
+# -------------------------------
+# Fetch and parse a single page (runs in a worker thread)
+# -------------------------------
+def parse_page(
+    url: str,
+    html: str,
+    headers: dict,
+    previous: dict = None,
+    parser_backend: str = None,
+    split_sections: bool = True,
+    min_section_tokens: int = 50
+) -> dict:
+    # One parse, one traversal for the visible text, sections and links
+    extracted = extract(html, url, backend=parser_backend)
+    links = extracted['links']
+
+    if split_sections:
+        records = [
+            {'url': url, **section}
+            for section in merge_short_sections(extracted['sections'], min_section_tokens)
+        ]
+    else:
+        records = [{
+            'url': url,
+            'section_title': "Full Page",
+            'h_level': 0,
+            'text': extracted['text']
+        }]
+    page_hash = content_hash(records)
+    changed = not previous or previous.get('content_hash') != page_hash
+
+    return {
+        'url': url,
+        'changed': changed,
+        'records': records if changed else [],
+        'links': links,
+        'etag': headers.get('ETag', ''),
+        'last_modified': headers.get('Last-Modified', ''),
+        'content_hash': page_hash,
+        # Kept with the manifest so unchanged pages still count as originals
+        # for near-duplicate filtering (see rag.dedup.filter_pages)
+        'simhash': simhash(page_text(records))
+    }
+
+def fetch_page(
+    url: str,
+    fetcher: Fetcher,
+    previous: dict = None,
+    parser_backend: str = None,
+    split_sections: bool = True,
+    min_section_tokens: int = 50,
+    page_store=None
+):
+    """
+    Fetch and parse `url`. When `previous` (the page's manifest entry from
+    the last crawl) is given, the request is conditional and the page comes
+    back with `changed=False` and no records if the server answers 304 or
+    the extracted text hashes the same as before.
+
+    With a rag.pagestore.PageStore, the raw HTML of changed pages (and of
+    pages the store doesn't hold yet) is appended to it.
+    """
+    headers = conditional_headers(previous) if previous else None
+    response = fetcher.fetch(url, headers=headers)
+    if response is None:
+        return None
+    if response['status'] == 304 and previous:
+        return unchanged_page(url, previous)
+
+    page = parse_page(
+        url, response['text'], response['headers'], previous,
+        parser_backend, split_sections, min_section_tokens
+    )
+    if page_store is not None and (page['changed'] or url not in page_store):
+        page_store.append(url, response['text'], response['headers'], response['status'])
+    return page
+
+def replay_pages(
+    page_store,
+    parser_backend: str = None,
+    split_sections: bool = True,
+    min_section_tokens: int = 50
+):
+    """
+    Re-parse every page held in a PageStore, yielding the same page dicts a
+    crawl would (all marked changed), e.g. to feed embed_pages() after a
+    change to chunking or to the embedding model. No request is made.
+    """
+    for stored in page_store.iter_pages():
+        yield parse_page(
+            stored['url'], stored['text'], stored['headers'], None,
+            parser_backend, split_sections, min_section_tokens
+        )
 
-    body = soup.body
-    if not body:
-        return []
+# -------------------------------
+# Per-host politeness budget
+# -------------------------------
+class HostBudget:
+    """
+    Caps the number of concurrent requests to one host and spaces request
+    starts at least `delay` seconds apart.
+    """
+    def __init__(self, concurrency: int = 4, delay: float = 1.0):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.delay = delay
+        self._next_slot = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.delay
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+# -------------------------------
+# Async crawl engine
+# -------------------------------
+class AsyncCrawler:
+    """
+    Breadth-first crawler with a bounded worker pool. Blocking fetches and
+    HTML parsing run in a thread pool; the event loop only schedules work and
+    enforces the per-host budgets. All workers share one pooled Fetcher, so
+    connections to the site are reused across pages. URLs are queued once
+    each in a rag.frontier.Frontier, ordered by depth and URL priority.
+    """
+    def __init__(
+        self,
+        start_url: str,
+        max_pages: int = 50,
+        delay: float = 1.0,
+        max_depth: int = None,
+        max_retries: int = 3,
+        concurrency: int = 8,
+        per_host_concurrency: int = 4,
+        fetcher: Fetcher = None,
+        manifest: dict = None,
+        use_sitemaps: bool = True,
+        respect_robots: bool = True,
+        parser_backend: str = None,
+        split_sections: bool = True,
+        min_section_tokens: int = 50,
+        on_page=None,
+        resume: dict = None,
+        seeds: list = None,
+        follow_links: bool = True,
+        page_store=None
+    ):
+        self.start_url = start_url
+        self.domain = urlparse(start_url).netloc
+        self.max_pages = max_pages
+        self.delay = delay
+        self.max_depth = max_depth
+        self.max_retries = max_retries
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.fetcher = fetcher
+        self.manifest = manifest or {}
+        self.use_sitemaps = use_sitemaps
+        self.respect_robots = respect_robots
+        self.parser_backend = parser_backend
+        self.split_sections = split_sections
+        self.min_section_tokens = min_section_tokens
+        # When set, each fetched page is handed to on_page (from a worker
+        # thread) instead of its records being accumulated in self.results.
+        self.on_page = on_page
+        # With follow_links off only the start URL (or `seeds`, a list of
+        # (url, depth)) is fetched; discovered links are still recorded.
+        self.follow_links = follow_links
+        # Optional rag.pagestore.PageStore that keeps the raw HTML fetched
+        self.page_store = page_store
+        self.stopped = False
+        # Set by run(): the frontier ran dry, so every reachable page was crawled
+        self.exhausted = False
+        self.robots = None
+        self.host_delays = {}
+
+        self.pages_scraped = 0
+        self.in_flight = 0
+        self.results = []
+        self.pages = {}
+        self.gone = set()  # URLs that answered 404 or 410
+        self._hosts = {}
+        # Claimed URLs whose page hasn't been acknowledged as stored yet.
+        # Guarded by _lock because snapshot() and ack() run on other threads.
+        self.unacked = {}
+        self._lock = threading.Lock()
+        self.resumed = resume is not None
+        if resume is not None:
+            self.frontier = Frontier.restore(resume['frontier'])
+            self.pages = dict(resume['pages'])
+            self.gone = set(resume.get('gone', []))
+            self.pages_scraped = len(self.pages)
+        else:
+            self.frontier = Frontier()
+            for url, depth in seeds if seeds is not None else [(start_url, 0)]:
+                self._enqueue(url, depth)
 
-    sections = []
-    block_tags = ['p', 'li', 'section', 'div', 'article', 'main']
+    def host_budget(self, url: str) -> HostBudget:
+        host = urlparse(url).netloc
+        if host not in self._hosts:
+            delay = max(self.delay, self.host_delays.get(host, 0))
+            self._hosts[host] = HostBudget(self.per_host_concurrency, delay)
+        return self._hosts[host]
 
-    for element in body.find_all(block_tags + ['h1','h2','h3','h4','h5','h6'], recursive=True):
-        if element.name.startswith('h'):
-            current_header = element.get_text(strip=True) or "Untitled"
-            h_level = int(element.name[1])
-            current_text = []
+    def _load_site_hints(self):
+        if not (self.use_sitemaps or self.respect_robots):
+            return
+        max_seeds = self.max_pages if self.max_pages is not None else 50000
+        use_sitemaps = self.use_sitemaps and not self.resumed
+        hints = load_site_hints(self.fetcher, self.start_url, max_urls=max_seeds, use_sitemaps=use_sitemaps)
+        if self.respect_robots:
+            self.robots = hints['robots']
+            if hints['delay']:
+                logging.info(f"Honouring robots.txt delay of {hints['delay']}s for {self.domain}")
+                self.host_delays[self.domain] = hints['delay']
+        # Sitemap URLs go right after the start page, newest first, so the
+        # page budget reaches deep content before nav-heavy link chains.
+        # A resumed frontier already holds them.
+        if self.resumed:
+            return
+        with self._lock:
+            for seed in hints['seeds']:
+                self._enqueue(seed, 1, from_sitemap=True)
 
-            for sibling in element.find_next_siblings():
-                if sibling.name and sibling.name.startswith('h'):
+    def _enqueue(self, url: str, depth: int, from_sitemap: bool = False):
+        if self.max_depth is not None and depth > self.max_depth:
+            return
+        self.frontier.push(url, depth, key=normalize_url(url), from_sitemap=from_sitemap)
+
+    def _allowed(self, url: str) -> bool:
+        return self.robots is None or self.robots.can_fetch(ROBOTS_AGENT, url)
+
+    def _budget_left(self) -> bool:
+        return self.max_pages is None or self.pages_scraped + self.in_flight < self.max_pages
+
+    def stop(self):
+        """Stop claiming new URLs; pages already in flight still finish."""
+        self.stopped = True
+
+    def ack(self, urls):
+        """Mark pages as durably stored, so snapshots treat them as done."""
+        with self._lock:
+            for url in urls:
+                self.unacked.pop(url, None)
+
+    def recheck(self, url: str):
+        """
+        Drop the validators and content hash kept for a fetched page, so the
+        next recrawl downloads it in full and treats it as changed.
+        """
+        with self._lock:
+            page = self.pages.get(url)
+            if page is not None:
+                self.pages[url] = {**page, 'etag': '', 'last_modified': '', 'content_hash': ''}
+
+    def snapshot(self) -> dict:
+        """
+        JSON-serialisable crawl state to resume from. URLs that were claimed
+        but not acknowledged go back on the frontier, so a page is never
+        counted as done before its chunks are stored.
+        """
+        with self._lock:
+            pending = dict(self.unacked)
+            frontier = self.frontier.snapshot()
+            frontier['queue'] = [
+                [url, depth, self.frontier.priority(url, depth)] for url, depth in pending.items()
+            ] + frontier['queue']
+            return {
+                'frontier': frontier,
+                'pages': {url: page for url, page in self.pages.items() if url not in pending},
+                'gone': sorted(self.gone)
+            }
+
+    def removed_urls(self) -> set:
+        """
+        Manifest URLs whose pages should be deleted after the crawl: those
+        that answered 404/410, and those not reached again if the frontier
+        ran dry. When max_pages or stop() ended the crawl first, an
+        unreached page may just not have come up this time, so it is kept.
+        """
+        removed = set(self.gone)
+        if self.exhausted:
+            removed |= set(self.manifest) - set(self.pages)
+        return removed
+
+    def _claim_next(self):
+        # Pages in flight count against max_pages so workers never overshoot it
+        # Held throughout so a snapshot never sees a URL popped but not yet claimed
+        with self._lock:
+            while self._budget_left() and not self.stopped:
+                item = self.frontier.pop()
+                if item is None:
                     break
-                if sibling.name in block_tags:
-                    text = sibling.get_text(" ", strip=True)
-                    if text:
-                        current_text.append(' '.join(text.split()))
-
-            section_text = ' '.join(current_text).strip()
-            token_count = count_tokens(section_text)
-            if token_count >= min_tokens:
-                sections.append({
-                    'section_title': current_header,
-                    'h_level': h_level,
-                    'text': section_text
-                })
-            else:
-                logging.debug(f"Section '{current_header}' skipped (tokens: {token_count})")
-
-    # Fallback: If no sections found, extract all visible text from body
-    if not sections:
-        all_text = body.get_text(" ", strip=True)
-        all_text = ' '.join(all_text.split())
-        token_count = count_tokens(all_text)
-        if token_count >= min_tokens:
-            sections.append({
-                'section_title': "No Section Title",
-                'h_level': 0,
-                'text': all_text
-            })
-
-    return sections
-
-def extract_page_text(soup: BeautifulSoup) -> str:
-    # Remove unwanted tags
-    for tag in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-        tag.decompose()
-    body = soup.body
-    if not body:
-        return ""
-    # Get all visible text from body
-    text = body.get_text(" ", strip=True)
-    return ' '.join(text.split())
-
-# -------------------------------
-# Crawl function
+                url, depth = item
+                if not self._allowed(url):
+                    logging.debug(f"Skipping {url}: disallowed by robots.txt")
+                    continue
+                self.unacked[url] = depth
+                self.in_flight += 1
+                return url, depth
+        return None
+
+    async def _next_url(self, cond: asyncio.Condition):
+        async with cond:
+            while True:
+                item = self._claim_next()
+                if item is not None or self.in_flight == 0:
+                    return item
+                # Wait for an in-flight page to either add links or free its slot
+                await cond.wait()
+
+    async def _fetch(self, url: str, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        previous = self.manifest.get(url)
+        for attempt in range(self.max_retries):
+            try:
+                async with self.host_budget(url):
+                    return await loop.run_in_executor(
+                        executor, fetch_page, url, self.fetcher, previous,
+                        self.parser_backend, self.split_sections, self.min_section_tokens,
+                        self.page_store
+                    )
+            except HTTPError as e:
+                if e.response is not None and e.response.status_code in GONE_STATUSES:
+                    logging.info(f"{url} is gone ({e.response.status_code})")
+                    with self._lock:
+                        self.gone.add(url)
+                    return None
+                error = e
+            except Exception as e:
+                error = e
+            wait_time = 2 ** attempt
+            logging.warning(f"Attempt {attempt+1} failed for {url}: {error}. Retrying in {wait_time}s...")
+            await asyncio.sleep(wait_time)
+        logging.error(f"Failed to fetch {url} after {self.max_retries} attempts")
+        # A transient failure shouldn't drop a known page from the index
+        if previous:
+            return unchanged_page(url, previous)
+        return None
+
+    def _record(self, page: dict, depth: int):
+        if self.on_page is None:
+            self.results.extend(page['records'])
+            self.ack([page['url']])
+        self.pages_scraped += 1
+        if self.pages_scraped % 5 == 0:
+            logging.info(f"Scraped {self.pages_scraped} pages...")
+
+        with self._lock:
+            page_links = []
+            for next_url in page['links']:
+                norm_next = normalize_url(next_url)
+                if urlparse(norm_next).netloc == self.domain:
+                    page_links.append(norm_next)
+                    if self.follow_links:
+                        self._enqueue(norm_next, depth + 1)
+
+            self.pages[page['url']] = {
+                'etag': page['etag'],
+                'last_modified': page['last_modified'],
+                'content_hash': page['content_hash'],
+                'simhash': page['simhash'],
+                'links': list(dict.fromkeys(page_links)),
+                'changed': page['changed']
+            }
+
+    async def _worker(self, cond: asyncio.Condition, executor: ThreadPoolExecutor):
+        while True:
+            item = await self._next_url(cond)
+            if item is None:
+                return
+            url, depth = item
+            page = None
+            try:
+                page = await self._fetch(url, executor)
+            finally:
+                async with cond:
+                    self.in_flight -= 1
+                    if page is not None:
+                        self._record(page, depth)
+                    else:
+                        # Skipped or failed: nothing to store, so nothing to wait for
+                        self.ack([url])
+                    cond.notify_all()
+            if page is not None and self.on_page is not None:
+                # on_page may block (e.g. a full queue); keep that off the event loop
+                await asyncio.get_running_loop().run_in_executor(executor, self.on_page, page)
+
+    async def run(self) -> list:
+        cond = asyncio.Condition()
+        owns_fetcher = self.fetcher is None
+        if owns_fetcher:
+            self.fetcher = Fetcher(pool_size=self.concurrency)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                await asyncio.get_running_loop().run_in_executor(executor, self._load_site_hints)
+                await asyncio.gather(*(self._worker(cond, executor) for _ in range(self.concurrency)))
+        finally:
+            if owns_fetcher:
+                self.fetcher.close()
+        self.exhausted = not self.stopped and not len(self.frontier)
+        stats = self.frontier.stats()
+        logging.info(
+            f"Crawling complete. {self.pages_scraped} pages scraped, {stats['seen']} URLs seen, "
+            f"{stats['queued']} left queued, {stats['duplicate_rate']:.0%} of discovered links were duplicates."
+        )
+        return self.results
+
+# -------------------------------
+# Crawl functions
 # -------------------------------
+async def crawl_async(start_url: str, **kwargs) -> list:
+    return await AsyncCrawler(start_url, **kwargs).run()
+
 def crawl(
     start_url: str,
     max_pages: int = 50,
     delay: float = 1.0,
     max_depth: int = None,
-    max_retries: int = 3
+    max_retries: int = 3,
+    concurrency: int = 8,
+    per_host_concurrency: int = 4,
+    use_sitemaps: bool = True,
+    respect_robots: bool = True,
+    split_sections: bool = True
 ):
-    visited = set()
-    queue = deque([(start_url, 0)])
-    pages_scraped = 0
-    results = []
-
-    while queue and (max_pages is None or pages_scraped < max_pages):
-        url, depth = queue.popleft()
-        norm_url = normalize_url(url)
-        if norm_url in visited or (max_depth is not None and depth > max_depth):
-            continue
+    """
+    Crawl `start_url` and its same-domain links. `delay` is the minimum gap
+    between two requests to the same host (raised to the site's robots.txt
+    Crawl-delay if larger); up to `per_host_concurrency` requests per host
+    and `concurrency` overall run at once. URLs from the site's sitemaps are
+    queued right after `start_url`, most recently modified first.
 
-        for attempt in range(max_retries):
-            try:
-                headers = {'User-Agent': 'Mozilla/5.0 (compatible; CrawlerBot/1.0)'}
-                response = requests.get(url, timeout=5, headers=headers)
-                response.raise_for_status()
-                break
-            except Exception as e:
-                wait_time = 2 ** attempt
-                logging.warning(f"Attempt {attempt+1} failed for {url}: {e}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-        else:
-            logging.error(f"Failed to fetch {url} after {max_retries} attempts")
-            continue
+    With `split_sections` each page yields one record per heading-scoped
+    section (short sections merged into their neighbours); otherwise one
+    "Full Page" record per page.
+    """
+    return asyncio.run(crawl_async(
+        start_url,
+        max_pages=max_pages,
+        delay=delay,
+        max_depth=max_depth,
+        max_retries=max_retries,
+        concurrency=concurrency,
+        per_host_concurrency=per_host_concurrency,
+        use_sitemaps=use_sitemaps,
+        respect_robots=respect_robots,
+        split_sections=split_sections
+    ))
 
-        visited.add(norm_url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        page_text = extract_page_text(soup)
+def iter_crawl(crawler: AsyncCrawler, buffer_pages: int = 16):
+    """
+    Run `crawler` on a background thread and yield its pages
+    ({'url', 'changed', 'records', ...}) as soon as they are fetched, so
+    chunking and embedding overlap with network time. At most `buffer_pages`
+    pages wait in memory: when the consumer falls behind, crawl workers block
+    until it catches up. After iteration, `crawler.pages` holds the manifest.
+    """
+    pages = queue.Queue(maxsize=buffer_pages)
+    done = object()
+    errors = []
 
-        results.append({
-            'url': url,
-            'section_title': "Full Page",
-            'h_level': 0,
-            'text': page_text
-        })
-
-        pages_scraped += 1
-        if pages_scraped % 5 == 0:
-            logging.info(f"Scraped {pages_scraped} pages...")
-
-        for link in soup.find_all('a', href=True):
-            next_url = urljoin(url, link['href'])
-            norm_next = normalize_url(next_url)
-            if urlparse(norm_next).netloc == urlparse(start_url).netloc and norm_next not in visited:
-                queue.append((norm_next, depth + 1))
+    def emit(item):
+        # Give up if the consumer went away, so the crawl thread can't hang
+        while not crawler.stopped:
+            try:
+                pages.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
 
-        time.sleep(delay)
+    def run():
+        try:
+            asyncio.run(crawler.run())
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            emit(done)
 
-    logging.info(f"Crawling complete. {pages_scraped} pages scraped.")
-    return results
+    crawler.on_page = emit
+    thread = threading.Thread(target=run, name="crawler", daemon=True)
+    thread.start()
+    try:
+        while True:
+            page = pages.get()
+            if page is done:
+                break
+            yield page
+    finally:
+        crawler.stop()
+        thread.join()
+    if errors:
+        raise errors[0]
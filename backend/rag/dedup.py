@@ -0,0 +1,149 @@
+import hashlib
+import logging
+import re
+from itertools import groupby
+
+import numpy as np
+
+# -------------------------------
+# SimHash fingerprints
+# -------------------------------
+SHINGLE_WORDS = 3
+# Pages shorter than this are never treated as duplicates: a handful of
+# shingles gives a fingerprint too noisy to compare.
+MIN_WORDS = 20
+WORD_RE = re.compile(r'\w+')
+
+def _shingle_hashes(words: list) -> np.ndarray:
+    shingles = (' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1))
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big') for s in shingles],
+        dtype='>u8'
+    )
+
+def simhash(text: str):
+    """
+    64-bit SimHash of the text's 3-word shingles, or None when the text has
+    fewer than MIN_WORDS words. Texts sharing most of their shingles get
+    fingerprints a few bits apart.
+    """
+    words = WORD_RE.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = _shingle_hashes(words)
+    # One row of 64 bits per shingle; a fingerprint bit is set when most
+    # shingles have it set.
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    majority = bits.sum(axis=0) * 2 > len(hashes)
+    return int.from_bytes(np.packbits(majority).tobytes(), 'big')
+
+def page_text(records: list) -> str:
+    """The text of a page's records, as fingerprinted for near-duplicate checks."""
+    return ' '.join(record['text'] for record in records)
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+# -------------------------------
+# Near-duplicate filter
+# -------------------------------
+class NearDuplicateFilter:
+    """
+    Remembers the SimHash of every page it keeps and flags later pages whose
+    fingerprint is within `max_distance` bits of one of them. Fingerprints
+    are split into max_distance + 1 bands; two fingerprints that close must
+    agree on at least one whole band, so only pages sharing a band are
+    compared.
+    """
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self._index = [{} for _ in range(self.bands)]
+        self.checked = 0
+        self.duplicates = 0
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            shift = band * self.band_bits
+            # The last band takes any bits left over by the integer split
+            if band == self.bands - 1:
+                yield band, fingerprint >> shift
+            else:
+                yield band, (fingerprint >> shift) & mask
+
+    def check(self, url: str, text: str):
+        """
+        Return the URL of an earlier page that `text` nearly duplicates, or
+        None after remembering this page as an original.
+        """
+        return self.check_fingerprint(url, simhash(text))
+
+    def check_fingerprint(self, url: str, fingerprint):
+        """check() for a page whose SimHash (or None) is already known."""
+        self.checked += 1
+        if fingerprint is None:
+            return None
+        keys = list(self._band_keys(fingerprint))
+        for band, key in keys:
+            for other, other_url in self._index[band].get(key, ()):
+                if hamming(fingerprint, other) <= self.max_distance:
+                    self.duplicates += 1
+                    return other_url
+        self._remember(url, keys, fingerprint)
+        return None
+
+    def remember(self, url: str, fingerprint: int):
+        """Treat a page as an original without checking it, e.g. one kept by an earlier crawl."""
+        self._remember(url, list(self._band_keys(fingerprint)), fingerprint)
+
+    def _remember(self, url: str, keys: list, fingerprint: int):
+        for band, key in keys:
+            self._index[band].setdefault(key, []).append((fingerprint, url))
+
+    def filter_pages(self, pages, on_duplicate=None):
+        """
+        Pass crawled pages through, emptying the records of changed pages
+        that nearly duplicate an earlier one. The emptied page still flows
+        on, so embed_pages() drops its old chunks and the crawl checkpoint
+        still advances; 'duplicate_of' names the page it copies.
+
+        Unchanged pages keep the chunks of an earlier crawl, so they aren't
+        checked; their 'simhash' (kept in the crawl manifest) makes them
+        originals that changed pages are compared against.
+
+        `on_duplicate(url)` is called for each dropped page, e.g.
+        AsyncCrawler.recheck, so its content hash isn't kept: otherwise the
+        next recrawl sees it unchanged and never embeds it, even after the
+        page it duplicated changes or goes away.
+        """
+        for page in pages:
+            if page['changed']:
+                if 'simhash' in page:
+                    original = self.check_fingerprint(page['url'], page['simhash'])
+                else:
+                    original = self.check(page['url'], page_text(page['records']))
+                if original is not None:
+                    logging.debug(f"Skipping {page['url']}: near-duplicate of {original}")
+                    page = {**page, 'records': [], 'duplicate_of': original}
+                    if on_duplicate is not None:
+                        on_duplicate(page['url'])
+            elif page.get('simhash') is not None:
+                self.remember(page['url'], page['simhash'])
+            yield page
+
+    def filter_records(self, records):
+        """Drop every record of a page that nearly duplicates an earlier page."""
+        for url, page_records in groupby(records, key=lambda record: record.get('url', '')):
+            page_records = list(page_records)
+            text = ' '.join(str(record.get('text', '')) for record in page_records)
+            if self.check(url, text) is None:
+                yield from page_records
+
+    def stats(self) -> dict:
+        return {
+            'checked': self.checked,
+            'duplicates': self.duplicates,
+            'duplicate_rate': self.duplicates / self.checked if self.checked else 0.0
+        }
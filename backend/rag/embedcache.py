@@ -0,0 +1,248 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# -------------------------------
+# Content-addressed embedding cache
+# -------------------------------
+KEY_BYTES = 16
+SQL_BATCH = 500  # keys per IN (...) query, under SQLite's variable limit
+
+def cache_key(model_id: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model_id}\0{text}".encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+class EmbeddingCache:
+    """
+    Vectors of chunk texts already embedded, keyed by hash(model id, text),
+    so a recrawl, a second bot on the same site or a rerun ingest only
+    embeds text the model has never seen. Lives in a directory holding:
+
+        vectors.bin  fixed-size records (key, float32 vector), memory-mapped
+        index.db     SQLite: key -> record slot and last use
+
+    At most `max_entries` vectors are kept; past that, the least recently
+    used are evicted and their slots reused. Writes happen in an immediate
+    SQLite transaction, so worker processes can share one cache. A record
+    carries its own key, and readers check it before and after copying the
+    vector, so a slot reused by another process mid-read counts as a miss.
+    """
+    def __init__(self, path: str, max_entries: int = 100_000):
+        self.path = path
+        self.max_entries = max_entries
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, 'index.db'), timeout=60, check_same_thread=False,
+                                   isolation_level=None)  # transactions are explicit
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, slot INTEGER NOT NULL, last_used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+            CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        self._records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __getstate__(self):
+        # Pool workers reopen the cache from its path
+        return {'path': self.path, 'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def close(self):
+        self._records = None
+        self._db.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _meta(self, name: str, default: int = 0) -> int:
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, **values):
+        self._db.executemany(
+            "INSERT INTO meta (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+            values.items()
+        )
+
+    def _count(self, **deltas):
+        self._db.executemany(
+            "INSERT INTO meta (name, value) VALUES (?, ?) ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            deltas.items()
+        )
+
+    def _open_records(self, dim: int):
+        # The vector size is fixed by the first write; a model with another
+        # size needs its own cache directory
+        stored = self._meta('dim')
+        if stored and stored != dim:
+            raise ValueError(f"Embedding cache at {self.path} holds {stored}-d vectors, not {dim}-d")
+        if self._records is None:
+            dtype = np.dtype([('key', f'V{KEY_BYTES}'), ('vector', np.float32, (dim,))])
+            data_path = os.path.join(self.path, 'vectors.bin')
+            size = self.max_entries * dtype.itemsize
+            if not os.path.exists(data_path) or os.path.getsize(data_path) < size:
+                # Sparse on most filesystems: disk is used as slots fill up
+                with open(data_path, 'ab') as f:
+                    f.truncate(size)
+            self._records = np.memmap(data_path, dtype=dtype, mode='r+', shape=(self.max_entries,))
+        return self._records
+
+    def get_many(self, keys: list) -> dict:
+        """{key: vector} for the keys that are cached."""
+        found = {}
+        with self._lock:
+            dim = self._meta('dim')
+            if not dim or not keys:
+                return found
+            records = self._open_records(dim)
+            rows = []
+            for start in range(0, len(keys), SQL_BATCH):
+                batch = keys[start:start + SQL_BATCH]
+                rows += self._db.execute(
+                    f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+            if not rows:
+                return found
+            hit_keys = [bytes(key) for key, _ in rows]
+            slots = np.array([slot for _, slot in rows])
+            expected = np.array(hit_keys, dtype=f'V{KEY_BYTES}')
+            copied = records[slots]
+            valid = (copied['key'] == expected) & (records['key'][slots] == expected)
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(now, key) for key, ok in zip(hit_keys, valid) if ok]
+            )
+            # A slot holding another key means the entry was being evicted,
+            # or a crashed write rolled back; either way it is gone
+            stale = [(key, int(slot)) for key, slot, ok in zip(hit_keys, slots, valid) if not ok]
+            self._db.executemany("DELETE FROM entries WHERE key = ? AND slot = ?", stale)
+            self._db.executemany(
+                "INSERT OR IGNORE INTO free_slots (slot) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM entries WHERE slot = ?)",
+                [(slot, slot) for _, slot in stale]
+            )
+            self._db.commit()
+        for key, vector, ok in zip(hit_keys, copied['vector'], valid):
+            if ok:
+                found[key] = vector
+        return found
+
+    def put_many(self, keys: list, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not keys:
+            return
+        # A batch larger than the whole cache keeps its last max_entries
+        keys, vectors = keys[-self.max_entries:], vectors[-self.max_entries:]
+        with self._lock:
+            records = self._open_records(vectors.shape[1])
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if not self._meta('dim'):
+                    self._set_meta(dim=vectors.shape[1])
+                # Another process may have stored some of these meanwhile
+                present = set()
+                for start in range(0, len(keys), SQL_BATCH):
+                    batch = keys[start:start + SQL_BATCH]
+                    present.update(bytes(key) for (key,) in self._db.execute(
+                        f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(batch))})", batch
+                    ))
+                new = {}
+                for key, vector in zip(keys, vectors):
+                    if key not in present:
+                        new[key] = vector
+                if not new:
+                    self._db.commit()
+                    return
+                slots = self._allocate(len(new))
+                for slot, (key, vector) in zip(slots, new.items()):
+                    # Invalidate the slot first so a concurrent reader never
+                    # pairs the old key with part of the new vector
+                    records['key'][slot] = b'\0' * KEY_BYTES
+                    records['vector'][slot] = vector
+                    records['key'][slot] = key
+                records.flush()
+                now = time.time()
+                self._db.executemany(
+                    "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                    [(key, slot, now) for key, slot in zip(new, slots)]
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+
+    def _allocate(self, n: int) -> list:
+        slots = [slot for (slot,) in self._db.execute("SELECT slot FROM free_slots LIMIT ?", (n,))]
+        self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots])
+        next_slot = self._meta('next_slot')
+        fresh = min(n - len(slots), self.max_entries - next_slot)
+        slots += range(next_slot, next_slot + fresh)
+        self._set_meta(next_slot=next_slot + fresh)
+        if len(slots) < n:
+            # Full: evict a tenth of the cache at once, not one entry per write
+            needed = n - len(slots)
+            victims = self._db.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (max(needed, self.max_entries // 10),)
+            ).fetchall()
+            self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+            freed = [slot for _, slot in victims]
+            slots += freed[:needed]
+            self._db.executemany("INSERT INTO free_slots (slot) VALUES (?)", [(slot,) for slot in freed[needed:]])
+            self._count(evictions=len(victims))
+        return slots
+
+    def embed(self, texts: list, embedder) -> np.ndarray:
+        """embedder.embed(texts), calling the model only for texts not cached yet."""
+        texts = list(texts)
+        keys = [cache_key(embedder.model_id, text) for text in texts]
+        found = self.get_many(list(dict.fromkeys(keys)))
+        missing = list(dict.fromkeys(key for key in keys if key not in found))
+        if missing:
+            texts_by_key = dict(zip(keys, texts))
+            vectors = embedder.embed([texts_by_key[key] for key in missing])
+            self.put_many(missing, vectors)
+            found.update(zip(missing, vectors))
+        # Repeats within the batch count as hits: the model ran once for them
+        with self._lock:
+            self._count(hits=len(keys) - len(missing), misses=len(missing))
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+    def stats(self) -> dict:
+        """Counts across every process using this cache since it was created."""
+        with self._lock:
+            hits, misses = self._meta('hits'), self._meta('misses')
+            entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            evictions = self._meta('evictions')
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': evictions,
+        }
+
+class CachedEmbedder:
+    """An embedder that looks texts up in an EmbeddingCache before running the model."""
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.name = embedder.name
+        self.model_id = embedder.model_id
+
+    def embed(self, texts: list) -> np.ndarray:
+        return self.cache.embed(texts, self.embedder)
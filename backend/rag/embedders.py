@@ -0,0 +1,242 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import List
+import numpy as np
+
+# -------------------------------
+# Embedding backends
+# -------------------------------
+# Every backend turns a list of texts into an (n, dim) float32 array of
+# L2-normalised all-MiniLM-L6-v2 sentence vectors, so any of them can write
+# to or query the same collection. Vectors are handed to Chroma directly
+# (embeddings= / query_embeddings=), which keeps the embedding function a
+# collection was created with out of the hot path.
+MAX_SEQ_LENGTH = 256  # what sentence-transformers truncates MiniLM inputs to
+
+class SentenceTransformerEmbedder:
+    """The PyTorch model Chroma's SentenceTransformerEmbeddingFunction wraps."""
+    name = 'sentence-transformers'
+
+    def __init__(self, model_name: str = None):
+        from .registry import EMBEDDING_MODEL
+        self.model_name = model_name or EMBEDDING_MODEL
+        self.model_id = f"{self.name}/{self.model_name}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        from .registry import get_embedding_function
+        return np.asarray(get_embedding_function(self.model_name)(list(texts)), dtype=np.float32)
+
+class OnnxEmbedder:
+    """
+    MiniLM exported to ONNX, run with ONNX Runtime on the CPU: tokenization,
+    mean pooling and normalisation are the same as sentence-transformers',
+    without loading torch. Batches are padded to their longest text rather
+    than to MAX_SEQ_LENGTH, which is most of the speed-up on short chunks.
+
+    `model_dir` holds model.onnx and tokenizer.json; by default the export
+    Chroma downloads for its own ONNX embedding function is used. With
+    `quantized` the weights are converted to int8 once (model_int8.onnx,
+    next to the original), which needs the `onnx` package.
+    """
+    def __init__(self, model_dir: str = None, quantized: bool = False, batch_size: int = 32, threads: int = None):
+        self.model_dir = model_dir
+        self.quantized = quantized
+        self.batch_size = batch_size
+        self.threads = threads
+        self.name = 'onnx-int8' if quantized else 'onnx'
+        # Identifies the vectors in caches: int8 ones differ slightly from float
+        self.model_id = f"{self.name}/{model_dir or 'all-MiniLM-L6-v2'}"
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to pool workers as configuration; each loads its own session
+        return {**self.__dict__, '_session': None, '_tokenizer': None, '_lock': None}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _lock=threading.Lock())
+
+    def _model_dir(self) -> str:
+        if self.model_dir is None:
+            from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+            ONNXMiniLM_L6_V2()._download_model_if_not_exists()
+            self.model_dir = os.path.join(ONNXMiniLM_L6_V2.DOWNLOAD_PATH, ONNXMiniLM_L6_V2.EXTRACTED_FOLDER_NAME)
+        return self.model_dir
+
+    def _model_path(self) -> str:
+        model_path = os.path.join(self._model_dir(), 'model.onnx')
+        if not self.quantized:
+            return model_path
+        quantized_path = os.path.join(self._model_dir(), 'model_int8.onnx')
+        if not os.path.exists(quantized_path):
+            quantize_model(model_path, quantized_path)
+        return quantized_path
+
+    def _load(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime
+                    from tokenizers import Tokenizer
+                    tokenizer = Tokenizer.from_file(os.path.join(self._model_dir(), 'tokenizer.json'))
+                    tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+                    tokenizer.enable_padding(pad_id=0, pad_token='[PAD]')
+                    options = onnxruntime.SessionOptions()
+                    if self.threads:
+                        options.intra_op_num_threads = self.threads
+                    session = onnxruntime.InferenceSession(
+                        self._model_path(), options, providers=['CPUExecutionProvider']
+                    )
+                    self._inputs = {model_input.name for model_input in session.get_inputs()}
+                    self._tokenizer, self._session = tokenizer, session
+        return self._tokenizer, self._session
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        tokenizer, session = self._load()
+        texts = list(texts)
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            encodings = tokenizer.encode_batch(texts[start:start + self.batch_size])
+            feed = {
+                'input_ids': np.array([e.ids for e in encodings], dtype=np.int64),
+                'attention_mask': np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                'token_type_ids': np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = session.run(None, {name: value for name, value in feed.items() if name in self._inputs})[0]
+            vectors.append(mean_pool(hidden, feed['attention_mask']))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(vectors)
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Average of the token vectors the mask covers, scaled to unit length."""
+    mask = attention_mask[..., None].astype(np.float32)
+    pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+    return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+def quantize_model(model_path: str, quantized_path: str):
+    """Dynamic int8 quantization of the weights; activations stay float."""
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise RuntimeError("The onnx-int8 embedding backend needs the `onnx` package installed") from e
+    tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+    quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+    # Several workers may quantize at once; the last rename wins with an identical file
+    os.replace(tmp_path, quantized_path)
+    logging.info(f"Quantized {model_path} to int8 at {quantized_path}")
+
+BACKENDS = {
+    'sentence-transformers': SentenceTransformerEmbedder,
+    'onnx': OnnxEmbedder,
+    'onnx-int8': lambda: OnnxEmbedder(quantized=True),
+}
+
+# -------------------------------
+# Multi-process embedding
+# -------------------------------
+_worker_embedder = None
+
+def _init_worker(embedder, threads: int):
+    global _worker_embedder
+    # N processes with a thread pool each per core would oversubscribe the CPU
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    model = getattr(embedder, 'embedder', embedder)  # inside a CachedEmbedder
+    if getattr(model, 'threads', 0) is None:
+        model.threads = threads
+    _worker_embedder = embedder
+
+def _dimension() -> int:
+    model = getattr(_worker_embedder, 'embedder', _worker_embedder)  # keep the probe out of any cache
+    return model.embed(['dimension']).shape[1]
+
+def _embed_into(texts: list, shm_name: str, dim: int):
+    shm = SharedMemory(name=shm_name)
+    out = np.ndarray((len(texts), dim), dtype=np.float32, buffer=shm.buf)
+    try:
+        out[:] = _worker_embedder.embed(texts)
+    finally:
+        # The view must go before the mapping can be closed
+        del out
+        shm.close()
+
+class EmbeddingPool:
+    """
+    Embeds batches in worker processes, each with its own copy of the
+    model. Workers write vectors straight into a shared memory block per
+    batch, so nothing is pickled on the way back; the parent only chunks
+    and writes to Chroma, in order, while the next batches are embedded.
+
+        with EmbeddingPool(processes=8) as pool:
+            for (ids, texts, metadatas), vectors in pool.embed_batches(batches):
+                collection.add(ids=ids, documents=texts, metadatas=metadatas, embeddings=vectors)
+    """
+    def __init__(self, processes: int = None, embedder=None, threads_per_process: int = 1):
+        if embedder is None:
+            from .registry import get_embedder
+            embedder = get_embedder()
+        self.processes = processes or os.cpu_count() or 1
+        # Spawned rather than forked: forking a process whose torch or ONNX
+        # Runtime thread pools are already running can deadlock the child
+        self._executor = ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(embedder, threads_per_process),
+        )
+        self.dim = self._executor.submit(_dimension).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def embed_batches(self, batches, lookahead: int = None):
+        """
+        Yield (batch, vectors) for each (ids, texts, metadatas) batch, in
+        input order. `vectors` is a view of shared memory that is released
+        when the next batch is requested, so use or copy it before that.
+        At most `lookahead` batches (default two per process) are in flight.
+        """
+        batches = iter(batches)
+        pending = deque()
+
+        def submit(batch):
+            texts = batch[1]
+            shm = SharedMemory(create=True, size=max(1, len(texts) * self.dim * 4))
+            pending.append((batch, shm, self._executor.submit(_embed_into, texts, shm.name, self.dim)))
+
+        try:
+            for batch in itertools.islice(batches, lookahead or 2 * self.processes):
+                submit(batch)
+            while pending:
+                batch, shm, future = pending.popleft()
+                vectors = None
+                try:
+                    future.result()
+                    # Keep the workers busy while the caller writes this batch
+                    if (next_batch := next(batches, None)) is not None:
+                        submit(next_batch)
+                    vectors = np.ndarray((len(batch[1]), self.dim), dtype=np.float32, buffer=shm.buf)
+                    yield batch, vectors
+                finally:
+                    vectors = None
+                    shm.close()
+                    shm.unlink()
+        finally:
+            for _, shm, future in pending:
+                future.cancel()
+                shm.close()
+                shm.unlink()
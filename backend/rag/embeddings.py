@@ -1,173 +1,461 @@
-import pandas as pd
-from chromadb.utils import embedding_functions
-import chromadb
-from transformers import AutoTokenizer
 import re
-from io import StringIO
-from typing import List, Dict, Optional
-from functools import lru_cache
+import csv
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+import itertools
+import numpy as np
+from .dedup import NearDuplicateFilter
+from .embedcache import CachedEmbedder
+from .embedders import EmbeddingPool
+from .registry import get_collection, get_embedder, get_embedding_cache, update_vector_index
+
+if TYPE_CHECKING:
+    import chromadb
+
 # -------------------------------
 # Centralized tokenizer
 # -------------------------------
-tokenizer = AutoTokenizer.from_pretrained("sentence-transformers/all-MiniLM-L6-v2")
+# Loaded on first use: importing transformers and reading the tokenizer
+# costs seconds, and most processes importing this module (web workers,
+# manage.py commands) never tokenize anything.
+TOKENIZER_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+_tokenizer = None
+_offsets_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def _untruncated(backend):
+    # A copy of the Rust tokenizer that never truncates or pads, whatever
+    # tokenizer.json configured, so offsets cover whole documents
+    backend = type(backend).from_str(backend.to_str())
+    backend.no_truncation()
+    backend.no_padding()
+    return backend
+
+def get_tokenizer():
+    global _tokenizer, _offsets_tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+                _offsets_tokenizer = _untruncated(tokenizer.backend_tokenizer)
+                _tokenizer = tokenizer
+    return _tokenizer
+
+def get_offsets_tokenizer():
+    get_tokenizer()
+    return _offsets_tokenizer
+
+def __getattr__(name):
+    # Keeps `rag.embeddings.tokenizer` working without loading it at import
+    if name == 'tokenizer':
+        return get_tokenizer()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # -------------------------------
-# Token counting with caching
+# Token counting
 # -------------------------------
-@lru_cache(maxsize=100000)
 def count_tokens(text: str) -> int:
-    return len(tokenizer.encode(text, add_special_tokens=False))
+    return len(get_offsets_tokenizer().encode(text, add_special_tokens=False).ids)
 
 # -------------------------------
 # Regex-based sentence splitter
 # -------------------------------
+# Splits on '.', '?', or '!' followed by whitespace and a capital letter
+SENTENCE_ENDINGS = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+
 def split_into_sentences(text: str):
-    # This regex splits on '.', '?', or '!' followed by whitespace and a capital letter
-    sentence_endings = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
-    sentences = sentence_endings.split(text)
+    sentences = SENTENCE_ENDINGS.split(text)
     return [s.strip() for s in sentences if s.strip()]
 
+def sentence_spans(text: str) -> list:
+    """(start, end) character spans of the sentences split_into_sentences() returns."""
+    spans = []
+    start = 0
+    for match in itertools.chain(SENTENCE_ENDINGS.finditer(text), [None]):
+        end = match.start() if match else len(text)
+        segment = text[start:end]
+        stripped = segment.strip()
+        if stripped:
+            lead = len(segment) - len(segment.lstrip())
+            spans.append((start + lead, start + lead + len(stripped)))
+        if match:
+            start = match.end()
+    return spans
+
 # -------------------------------
 # Sliding-window chunking
 # -------------------------------
-def chunk_text(text: str, max_tokens: int = 400, overlap_tokens: int = 80) -> list:
-    sentences = split_into_sentences(text)
-    chunks = []
-    current_chunk = []
-    current_len = 0
-
-    for sentence in sentences:
-        sentence_len = count_tokens(sentence)
-        if current_len + sentence_len > max_tokens:
-            if current_chunk:
-                chunks.append(' '.join(current_chunk))
-            # Create overlap for next chunk
-            overlap_chunk = []
-            overlap_len = 0
-            if overlap_tokens > 0:
-                for s in reversed(current_chunk):
-                    l = count_tokens(s)
-                    if overlap_len + l <= overlap_tokens:
-                        overlap_chunk.insert(0, s)
-                        overlap_len += l
-                    else:
-                        break
-            current_chunk = overlap_chunk
-            current_len = sum(count_tokens(s) for s in current_chunk)
-        current_chunk.append(sentence)
-        current_len += sentence_len
-
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+def _sentence_token_counts(spans: list, offsets: list) -> np.ndarray:
+    # Each token belongs to the sentence its first character falls in.
+    # WordPiece never lets a token cross the whitespace between sentences,
+    # so this matches tokenizing every sentence on its own.
+    if not spans:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.array([start for start, _ in spans])
+    token_starts = np.array([start for start, end in offsets if end > start], dtype=np.int64)
+    owners = np.searchsorted(starts, token_starts, side='right') - 1
+    return np.bincount(owners[owners >= 0], minlength=len(spans))
 
+def _windows(counts: np.ndarray, max_tokens: int, overlap_tokens: int) -> list:
+    """
+    (first, last) sentence index ranges of each chunk: sentences are added
+    until the next would pass max_tokens, then the next window starts with
+    the longest run of trailing sentences that fits in overlap_tokens.
+    """
+    totals = np.concatenate(([0], np.cumsum(counts))).tolist()
+    windows = []
+    lo = 0
+    for hi in range(len(counts)):
+        if totals[hi + 1] - totals[lo] > max_tokens:
+            if hi > lo:
+                windows.append((lo, hi))
+            new_lo = hi
+            while overlap_tokens > 0 and new_lo > lo and totals[hi] - totals[new_lo - 1] <= overlap_tokens:
+                new_lo -= 1
+            lo = new_lo
+    if len(counts) > lo:
+        windows.append((lo, len(counts)))
+    return windows
+
+def chunk_texts(texts: list, max_tokens: int = 400, overlap_tokens: int = 80) -> list:
+    """
+    chunk_text() for a batch of documents: all of them are tokenized in one
+    call to the fast tokenizer, and sentence lengths are read off its offset
+    mapping instead of encoding every sentence separately.
+    """
+    if not texts:
+        return []
+    # The Rust tokenizer directly: no per-call Python wrapping, and no
+    # warning about documents longer than the model's 512 tokens
+    encodings = get_offsets_tokenizer().encode_batch(list(texts), add_special_tokens=False)
+    chunks = []
+    for text, encoding in zip(texts, encodings):
+        spans = sentence_spans(text)
+        counts = _sentence_token_counts(spans, encoding.offsets)
+        chunks.append([
+            ' '.join(text[start:end] for start, end in spans[lo:hi])
+            for lo, hi in _windows(counts, max_tokens, overlap_tokens)
+        ])
     return chunks
 
+def chunk_text(text: str, max_tokens: int = 400, overlap_tokens: int = 80) -> list:
+    return chunk_texts([text], max_tokens, overlap_tokens)[0]
+
 # -------------------------------
-# Create embeddings from CSV data
+# Stable, content-derived IDs
 # -------------------------------
-def create_embeddings_from_csv(
-    csv_data: str,
-    collection_name: str = "rag_collection",
-    persist_path: str = "chromadb_data",
-    batch_size: int = 500
-) -> chromadb.api.models.Collection.Collection:
-    if not csv_data.strip() or csv_data.strip() == '"url","section_title","h_level","text"':
-        raise ValueError("CSV data is empty or contains only headers. No data to embed.")
+def _hash(value: str) -> str:
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
 
-    df = pd.read_csv(StringIO(csv_data))
+def page_doc_id(url: str, n: int) -> str:
+    # The n-th record of a page; stable across crawls regardless of the
+    # order pages were discovered in.
+    return f"{_hash(url)}-{n}"
 
-    # Initialize ChromaDB embedding function
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
+def chunk_id(url: str, section_title: str, chunk: str) -> str:
+    """
+    Derived from the page, section and text of a chunk, so an unchanged
+    chunk keeps its ID whatever order pages are crawled or rows imported
+    in, and re-ingesting it is a no-op.
+    """
+    return f"{_hash(url)}-{_hash(section_title + chr(0) + chunk)}"
 
-    # Initialize ChromaDB PersistentClient
-    chroma_client = chromadb.PersistentClient(path=persist_path)
+# Records per tokenizer call when chunking
+TOKENIZE_BATCH = 64
 
-    # Get or create collection
-    collection = chroma_client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=sentence_transformer_ef
-    )
+def iter_chunks(records, records_per_url: dict = None):
+    """
+    Yield (chunk_id, chunk, metadata) for each chunk of each record.
+    `records_per_url` carries the per-page record counter across calls.
+    A chunk repeated within a run of records of one URL gets a numbered
+    ID from its second occurrence on.
+    """
+    if records_per_url is None:
+        records_per_url = defaultdict(int)
+    # Only the current URL's chunks are counted, so memory doesn't grow with the input
+    occurrences = defaultdict(int)
+    current_url = None
+    records = iter(records)
+    while batch := list(itertools.islice(records, TOKENIZE_BATCH)):
+        texts = [str(row.get('text') or '') for row in batch]
+        for row, chunks in zip(batch, chunk_texts(texts, max_tokens=400, overlap_tokens=80)):
+            url = str(row.get('url') or '')
+            section_title = str(row.get('section_title') or '')
+            if url != current_url:
+                occurrences.clear()
+                current_url = url
+            doc_id = page_doc_id(url, records_per_url[url])
+            records_per_url[url] += 1
 
-    all_texts: List[str] = []
-    all_metadatas: List[Dict] = []
-    all_ids: List[str] = []
-
-    for idx, row in df.iterrows():
-        text = str(row.get('text', ''))
-        url = str(row.get('url', ''))
-        section_title = str(row.get('section_title', ''))
-        doc_id = str(idx)
-
-        chunks = chunk_text(text, max_tokens=400, overlap_tokens=80)
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_{i}"
-
-            # Batch add
-            all_texts.append(chunk)
-            all_metadatas.append({
-                'doc_id': doc_id,
-                'section_title': section_title,
-                'url': url,
-                'chunk_index': i
-            })
-            all_ids.append(chunk_id)
-
-            if len(all_texts) >= batch_size:
-                collection.add(documents=all_texts, metadatas=all_metadatas, ids=all_ids)
-                all_texts, all_metadatas, all_ids = [], [], []
-
-    # Add remaining chunks
-    if all_texts:
-        collection.add(documents=all_texts, metadatas=all_metadatas, ids=all_ids)
+            for i, chunk in enumerate(chunks):
+                base_id = chunk_id(url, section_title, chunk)
+                occurrences[base_id] += 1
+                n = occurrences[base_id]
+                yield (base_id if n == 1 else f"{base_id}-{n}"), chunk, {
+                    'doc_id': doc_id,
+                    'section_title': section_title,
+                    'url': url,
+                    'chunk_index': i
+                }
 
-    return collection
+def iter_page_chunks(records):
+    """(url, chunks) for each run of consecutive records with the same URL."""
+    chunks_by_url = itertools.groupby(iter_chunks(records), key=lambda chunk: chunk[2]['url'])
+    for url, chunks in chunks_by_url:
+        yield url, list(chunks)
+
+# -------------------------------
+# Writing chunks
+# -------------------------------
+def ingest_embedder():
+    """The deployment's embedding backend, behind the embedding cache when one is configured."""
+    embedder = get_embedder()
+    cache = get_embedding_cache()
+    return CachedEmbedder(embedder, cache) if cache is not None else embedder
+
+def upsert_batch(collection, ids: list, texts: list, metadatas: list, embeddings=None):
+    # Embedded here with the deployment's backend rather than by the
+    # collection's embedding function (see rag.embedders)
+    if embeddings is None:
+        embeddings = ingest_embedder().embed(texts)
+    collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+
+def delete_url_chunks(collection, urls, batch_size: int = 500):
+    urls = list(urls)
+    for start in range(0, len(urls), batch_size):
+        collection.delete(where={'url': {'$in': urls[start:start + batch_size]}})
+
+class ChunkSync:
+    """
+    Brings whole pages' chunks into a collection with as few writes as
+    possible. Pages are buffered until about `batch_size` chunks are
+    pending; then the IDs the collection holds for those URLs are read and
+    compared with the new ones:
+
+        new IDs                      embedded and upserted
+        IDs no longer produced       deleted
+        same ID, moved in the page   metadata updated, vector untouched
+
+    With an EmbeddingPool, enough chunks are buffered to keep every worker
+    busy. A URL whose records come back later in the same run (they are
+    expected to be consecutive) only gains chunks, so nothing written in
+    this run is deleted.
+    """
+    def __init__(self, collection, batch_size: int = 500, pool: EmbeddingPool = None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.pool = pool
+        self.flush_at = batch_size * (2 * pool.processes if pool else 1)
+        self.pending = []
+        self.pending_chunks = 0
+        self.synced_urls = set()
+        self.written = self.updated = self.deleted = self.unchanged = 0
+
+    def add_page(self, url: str, chunks: list) -> bool:
+        """Queue the complete list of a page's chunks; returns True if a flush wrote it."""
+        self.pending.append((url, chunks))
+        self.pending_chunks += len(chunks)
+        if self.pending_chunks >= self.flush_at:
+            self.flush()
+            return True
+        return False
+
+    def _existing(self, urls: list) -> dict:
+        existing = {}
+        for start in range(0, len(urls), self.batch_size):
+            found = self.collection.get(
+                where={'url': {'$in': urls[start:start + self.batch_size]}}, include=['metadatas']
+            )
+            existing.update(zip(found['ids'], found['metadatas']))
+        return existing
+
+    def flush(self):
+        if not self.pending:
+            return
+        urls = list(dict.fromkeys(url for url, _ in self.pending))
+        chunks = {chunk[0]: chunk for _, page_chunks in self.pending for chunk in page_chunks}
+        existing = self._existing(urls)
+
+        stale = [
+            chunk_id for chunk_id, metadata in existing.items()
+            if chunk_id not in chunks and metadata.get('url') not in self.synced_urls
+        ]
+        for start in range(0, len(stale), self.batch_size):
+            self.collection.delete(ids=stale[start:start + self.batch_size])
+
+        moved = [chunk for chunk_id, chunk in chunks.items() if chunk_id in existing and existing[chunk_id] != chunk[2]]
+        for start in range(0, len(moved), self.batch_size):
+            batch = moved[start:start + self.batch_size]
+            self.collection.update(ids=[c[0] for c in batch], metadatas=[c[2] for c in batch])
+
+        new = [chunk for chunk_id, chunk in chunks.items() if chunk_id not in existing]
+        batches = (
+            tuple(map(list, zip(*new[start:start + self.batch_size])))
+            for start in range(0, len(new), self.batch_size)
+        )
+        if self.pool is None:
+            for ids, texts, metadatas in batches:
+                upsert_batch(self.collection, ids, texts, metadatas)
+        else:
+            for (ids, texts, metadatas), vectors in self.pool.embed_batches(batches):
+                upsert_batch(self.collection, ids, texts, metadatas, embeddings=vectors)
+
+        self.written += len(new)
+        self.updated += len(moved)
+        self.deleted += len(stale)
+        self.unchanged += len(chunks) - len(new) - len(moved)
+        self.synced_urls.update(urls)
+        self.pending.clear()
+        self.pending_chunks = 0
+
+    def stats(self) -> dict:
+        return {'written': self.written, 'updated': self.updated, 'deleted': self.deleted, 'unchanged': self.unchanged}
+
+def add_chunks_from_dicts(collection, data, batch_size: int = 500, pool: EmbeddingPool = None) -> int:
+    """
+    Chunk `data` and sync each page's chunks into the collection (see
+    ChunkSync). With an EmbeddingPool the new chunks are embedded in its
+    worker processes. Returns the number of chunks embedded and written.
+    """
+    sync = ChunkSync(collection, batch_size, pool)
+    for url, chunks in iter_page_chunks(data):
+        sync.add_page(url, chunks)
+    sync.flush()
+    logging.info(f"Synced chunks: {sync.stats()}")
+    return sync.written
+
+# -------------------------------
+# Streaming CSV ingestion
+# -------------------------------
+def iter_csv_records(source: Union[str, os.PathLike, io.IOBase]):
+    """
+    Rows of a crawl CSV export (url, section_title, h_level, text) as
+    dicts, read one at a time from a path or an open file, so memory use
+    doesn't depend on the size of the export.
+    """
+    # Whole pages can be one field, well past the csv module's 128 KiB default
+    csv.field_size_limit(max(csv.field_size_limit(), 2**31 - 1))
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+        return
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+        source = io.TextIOWrapper(source, encoding='utf-8', newline='')
+    yield from csv.DictReader(source)
+
+def _require_text(records: Iterable[dict], message: str):
+    # Fail before anything is written when no record has text, reading
+    # only up to the first one that does
+    records = iter(records)
+    head = []
+    for record in records:
+        head.append(record)
+        if record.get('text'):
+            return itertools.chain(head, records)
+    raise ValueError(message)
+
+def create_embeddings_from_csv_file(
+    source: Union[str, os.PathLike, io.IOBase],
+    collection_name: str = "rag_collection",
+    persist_path: str = "chromadb_data",
+    batch_size: int = 500,
+    processes: Optional[int] = None
+) -> 'chromadb.api.models.Collection.Collection':
+    """
+    Ingest a CSV export from a path or file object, streaming it through
+    the same chunk/sync path as create_embeddings_from_dicts. Rows of one
+    URL should be consecutive, as the crawler writes them.
+    """
+    records = _require_text(
+        iter_csv_records(source), "CSV data is empty or contains only headers. No data to embed."
+    )
+    return create_embeddings_from_dicts(
+        records, collection_name, persist_path, batch_size=batch_size, processes=processes
+    )
+
+def create_embeddings_from_csv(
+    csv_data: str,
+    collection_name: str = "rag_collection",
+    persist_path: str = "chromadb_data",
+    batch_size: int = 500
+) -> 'chromadb.api.models.Collection.Collection':
+    return create_embeddings_from_csv_file(io.StringIO(csv_data), collection_name, persist_path, batch_size)
 
 # -------------------------------
 # Create embeddings from scraped data
 # -------------------------------
 def create_embeddings_from_dicts(
-    data: list,
+    data: Iterable[dict],
     collection_name: str = "rag_collection",
     persist_path: str = "chromadb_data",
-    batch_size: int = 500
-) -> chromadb.api.models.Collection.Collection:
-    if not data or not any(d.get("text") for d in data):
-        raise ValueError("Scraped data is empty. No data to embed.")
+    batch_size: int = 500,
+    max_duplicate_distance: Optional[int] = None,
+    processes: Optional[int] = None
+) -> 'chromadb.api.models.Collection.Collection':
+    """
+    `data` can be any iterable of records, e.g. iter_csv_records(); it is
+    read once, a batch at a time. Chunks already in the collection are
+    kept, and chunks of these pages that are no longer produced are
+    deleted, so re-ingesting a site only embeds what changed.
 
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
-    chroma_client = chromadb.PersistentClient(path=persist_path)
-    collection = chroma_client.get_or_create_collection(
-        name=collection_name,
-        embedding_function=sentence_transformer_ef
-    )
+    With `max_duplicate_distance` set, pages whose SimHash is within that
+    many bits of an earlier page's are left out (see rag.dedup).
 
-    all_texts, all_metadatas, all_ids = [], [], []
-    for idx, row in enumerate(data):
-        text = str(row.get('text', ''))
-        url = str(row.get('url', ''))
-        section_title = str(row.get('section_title', ''))
-        doc_id = str(idx)
-
-        chunks = chunk_text(text, max_tokens=400, overlap_tokens=80)
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{doc_id}_{i}"
-            all_texts.append(chunk)
-            all_metadatas.append({
-                'doc_id': doc_id,
-                'section_title': section_title,
-                'url': url,
-                'chunk_index': i
-            })
-            all_ids.append(chunk_id)
-            if len(all_texts) >= batch_size:
-                collection.add(documents=all_texts, metadatas=all_metadatas, ids=all_ids)
-                all_texts, all_metadatas, all_ids = [], [], []
-
-    if all_texts:
-        collection.add(documents=all_texts, metadatas=all_metadatas, ids=all_ids)
+    With `processes` set, chunks are embedded by that many worker
+    processes (rag.embedders.EmbeddingPool) while this one writes them.
+    Worth it for large sites: each worker loads its own model first.
+    """
+    data = _require_text(data, "Scraped data is empty. No data to embed.")
 
+    if max_duplicate_distance is not None:
+        data = NearDuplicateFilter(max_duplicate_distance).filter_records(data)
+    collection = get_collection(collection_name, persist_path)
+    if processes:
+        with EmbeddingPool(processes, embedder=ingest_embedder()) as pool:
+            add_chunks_from_dicts(collection, data, batch_size=batch_size, pool=pool)
+    else:
+        add_chunks_from_dicts(collection, data, batch_size=batch_size)
+    update_vector_index(collection)
     return collection
+
+# -------------------------------
+# Embed pages while they are being crawled
+# -------------------------------
+def embed_pages(pages, collection, batch_size: int = 500, on_commit=None) -> int:
+    """
+    Chunk and embed pages as they arrive (e.g. from rag.crawler.iter_crawl).
+    Unchanged pages are skipped; changed ones are synced (see ChunkSync),
+    so only their new chunks are embedded and a page that lost all its
+    records loses its chunks. About one batch of chunks is held in memory.
+    Returns the number of chunks written.
+
+    `on_commit(urls)` is called after each batch is written with the pages
+    whose chunks are now all stored, so a checkpoint never gets ahead of
+    the collection.
+    """
+    sync = ChunkSync(collection, batch_size)
+    completed = []
+
+    def commit():
+        if on_commit is not None and completed:
+            on_commit(list(completed))
+        completed.clear()
+
+    for page in pages:
+        completed.append(page['url'])
+        if page['changed']:
+            if sync.add_page(page['url'], list(iter_chunks(page['records']))):
+                commit()
+        if not sync.pending:
+            # Nothing left to write for the pages so far; commit them now
+            commit()
+    sync.flush()
+    commit()
+    logging.info(f"Synced chunks: {sync.stats()}")
+    return sync.written
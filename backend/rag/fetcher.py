@@ -0,0 +1,136 @@
+import logging
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+# -------------------------------
+# Defaults
+# -------------------------------
+USER_AGENT = 'Mozilla/5.0 (compatible; CrawlerBot/1.0)'
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# urllib3 only decodes brotli when one of these packages is installed,
+# so only advertise it in that case.
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+# -------------------------------
+# Pooled keep-alive fetcher
+# -------------------------------
+class Fetcher:
+    """
+    Shared HTTP session for crawling. Connections are pooled and kept alive
+    per host, responses are streamed, and bodies are only downloaded when the
+    content type is wanted and the size stays under `max_bytes`.
+
+    A single Fetcher may be shared by the crawler's worker threads.
+    """
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: float = 5,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        user_agent: str = USER_AGENT
+    ):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'User-Agent': user_agent,
+            'Accept': 'text/html,application/xhtml+xml;q=0.9,*/*;q=0.1',
+            'Accept-Encoding': ACCEPT_ENCODING,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    @contextmanager
+    def stream(self, url: str, headers: dict = None):
+        """
+        Open a streamed GET for callers that parse the body incrementally.
+        Reads from `response.raw` are transparently decompressed.
+        """
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # Keep the raw stream readable at EOF so it can be wrapped in
+            # io.BufferedReader / gzip.GzipFile.
+            response.raw.auto_close = False
+            yield response
+
+    def _read_capped(self, response: requests.Response):
+        body = bytearray()
+        # iter_content yields decompressed bytes, so the cap applies to the
+        # decoded size rather than the (possibly gzipped) wire size.
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                return None
+        return bytes(body)
+
+    def fetch(self, url: str, headers: dict = None, content_types=HTML_CONTENT_TYPES):
+        """
+        GET `url` and return a dict with the final url, status, content type,
+        response headers and decoded text. Returns None when the response is
+        skipped because of its content type or size; HTTP errors raise.
+        """
+        with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code == 304:
+                return {
+                    'url': response.url,
+                    'status': response.status_code,
+                    'content_type': '',
+                    'headers': response.headers,
+                    'text': ''
+                }
+
+            content_type = response.headers.get('Content-Type', '')
+            mime = content_type.split(';')[0].strip().lower()
+            if content_types and mime and mime not in content_types:
+                logging.debug(f"Skipping {url}: content type {mime}")
+                return None
+
+            length = response.headers.get('Content-Length', '')
+            if length.isdigit() and int(length) > self.max_bytes:
+                logging.info(f"Skipping {url}: Content-Length {length} exceeds {self.max_bytes} bytes")
+                return None
+
+            body = self._read_capped(response)
+            if body is None:
+                logging.info(f"Skipping {url}: body exceeds {self.max_bytes} bytes")
+                return None
+
+            # requests falls back to ISO-8859-1 for text/* without a charset;
+            # modern sites are overwhelmingly UTF-8, so prefer that instead.
+            encoding = response.encoding if 'charset=' in content_type.lower() else 'utf-8'
+            try:
+                text = body.decode(encoding or 'utf-8', errors='replace')
+            except LookupError:
+                text = body.decode('utf-8', errors='replace')
+
+            return {
+                'url': response.url,
+                'status': response.status_code,
+                'content_type': mime,
+                'headers': response.headers,
+                'text': text
+            }
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; fall back to zlib
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # POSIX only; elsewhere appends are only safe within one process
+    fcntl = None
+
+# -------------------------------
+# Codecs
+# -------------------------------
+def _zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+def _zstd_decompress(data: bytes) -> bytes:
+    return zstandard.ZstdDecompressor().decompress(data)
+
+CODECS = {'zlib': (lambda data: zlib.compress(data, 6), zlib.decompress)}
+if zstandard is not None:
+    CODECS['zstd'] = (_zstd_compress, _zstd_decompress)
+DEFAULT_CODEC = 'zstd' if 'zstd' in CODECS else 'zlib'
+
+# Response headers kept with each page, under these names whatever case
+# the server sent them in (HTTP header names are case-insensitive)
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+_STORED_NAMES = {name.lower(): name for name in STORED_HEADERS}
+
+# -------------------------------
+# Append-only page store
+# -------------------------------
+class PageStore:
+    """
+    Raw pages of one site as fetched, so chunking and embedding can be
+    rebuilt without crawling the site again. Lives in a directory holding:
+
+        pages.dat  independently compressed records, one per fetch, appended
+        pages.idx  one JSON line per record: url, offset, length, codec,
+                   or a {url, deleted} line once a page is gone
+
+    A URL fetched again gets a new record; the index maps each URL to its
+    latest one. Data is written before its index line, so a crash leaves at
+    worst an unindexed tail that is ignored. Appends take an exclusive file
+    lock, so several worker processes on one host can share a store.
+    """
+    def __init__(self, path: str, codec: str = None):
+        self.path = path
+        self.codec = codec or DEFAULT_CODEC
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, 'pages.dat')
+        self.index_path = os.path.join(path, 'pages.idx')
+        self._lock = threading.Lock()
+        self._index = {}
+        self._index_size = 0
+        self._data = open(self.data_path, 'a+b')
+        self._index_file = open(self.index_path, 'a+b')
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._data.close()
+        self._index_file.close()
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def urls(self) -> list:
+        return list(self._index)
+
+    def refresh(self):
+        """Pick up records appended by other processes since the last read."""
+        with self._lock:
+            data_size = os.path.getsize(self.data_path)
+            self._index_file.seek(self._index_size)
+            for line in self._index_file:
+                # A partial last line is an append in progress or a crash
+                if not line.endswith(b'\n'):
+                    break
+                self._index_size += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # the remains of a torn write
+                    continue
+                if entry.get('deleted'):
+                    self._index.pop(entry['url'], None)
+                elif entry['offset'] + entry['length'] <= data_size:
+                    self._index[entry['url']] = entry
+
+    def _write_index(self, lines: list):
+        data = b''.join(json.dumps(line).encode('utf-8') + b'\n' for line in lines)
+        end = self._index_file.seek(0, os.SEEK_END)
+        if end:
+            # Terminate a line left half-written by a crash, so it stays on its own
+            self._index_file.seek(end - 1)
+            if self._index_file.read(1) != b'\n':
+                data = b'\n' + data
+        self._index_file.write(data)
+        self._index_file.flush()
+
+    def append(self, url: str, text: str, headers: dict = None, status: int = 200, fetched_at: float = None):
+        meta = {
+            'url': url,
+            'status': status,
+            'headers': {
+                _STORED_NAMES[name.lower()]: value
+                for name, value in (headers or {}).items() if name.lower() in _STORED_NAMES
+            },
+            'fetched_at': fetched_at or time.time(),
+        }
+        compress, _ = CODECS[self.codec]
+        payload = compress(json.dumps(meta).encode('utf-8') + b'\n' + text.encode('utf-8'))
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._data.fileno(), fcntl.LOCK_EX)
+            try:
+                self._data.seek(0, os.SEEK_END)
+                offset = self._data.tell()
+                self._data.write(payload)
+                self._data.flush()
+                entry = {'url': url, 'offset': offset, 'length': len(payload), 'codec': self.codec}
+                self._write_index([entry])
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._data.fileno(), fcntl.LOCK_UN)
+            self._index[url] = entry
+
+    def forget(self, urls):
+        """Drop pages that no longer exist on the site; their records go at the next compact()."""
+        urls = [url for url in urls if url in self._index]
+        if not urls:
+            return
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._data.fileno(), fcntl.LOCK_EX)
+            try:
+                self._write_index([{'url': url, 'deleted': True} for url in urls])
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._data.fileno(), fcntl.LOCK_UN)
+            for url in urls:
+                self._index.pop(url, None)
+
+    def _read(self, entry: dict) -> dict:
+        with self._lock:
+            self._data.seek(entry['offset'])
+            payload = self._data.read(entry['length'])
+        _, decompress = CODECS[entry['codec']]
+        meta, _, body = decompress(payload).partition(b'\n')
+        return {**json.loads(meta), 'text': body.decode('utf-8')}
+
+    def get(self, url: str):
+        """Latest stored copy of `url` as {'url', 'status', 'headers', 'fetched_at', 'text'}, or None."""
+        entry = self._index.get(url)
+        return self._read(entry) if entry is not None else None
+
+    def iter_pages(self):
+        """Latest copy of every page, read in file order so the disk is scanned sequentially."""
+        for entry in sorted(self._index.values(), key=lambda entry: entry['offset']):
+            yield self._read(entry)
+
+    def compact(self):
+        """
+        Rewrite the store with only the latest record of each live URL.
+        Must not run while a crawl is writing to the store.
+        """
+        tmp = PageStore(self.path + '.compact', codec=self.codec)
+        with tmp:
+            for page in self.iter_pages():
+                tmp.append(page['url'], page['text'], page['headers'], page['status'], page['fetched_at'])
+        with self._lock:
+            self.close()
+            os.replace(tmp.data_path, self.data_path)
+            os.replace(tmp.index_path, self.index_path)
+            os.rmdir(tmp.path)
+            self._data = open(self.data_path, 'a+b')
+            self._index_file = open(self.index_path, 'a+b')
+            self._index, self._index_size = {}, 0
+        self.refresh()
@@ -0,0 +1,104 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# -------------------------------
+# Query normalisation
+# -------------------------------
+_SPACES = re.compile(r'\s+')
+
+def normalize_query(query: str) -> str:
+    """Case, surrounding punctuation and runs of whitespace don't change the answer."""
+    return _SPACES.sub(' ', query).strip().strip('?!.').strip().lower()
+
+def cache_key(*parts) -> str:
+    # Short and free of spaces, so any cache backend accepts it
+    return hashlib.sha1('\0'.join(map(str, parts)).encode('utf-8')).hexdigest()
+
+# -------------------------------
+# In-process LRU + TTL cache
+# -------------------------------
+class LRUCache:
+    """
+    At most `max_entries` values, each dropped `ttl` seconds after it was
+    stored; when full, the least recently used entry goes first.
+    """
+    def __init__(self, max_entries: int = 10_000, ttl: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+# -------------------------------
+# Shared cache
+# -------------------------------
+class SharedCache:
+    """
+    The same interface over a Django-style cache (e.g. the Redis 'shared'
+    one in settings.CACHES), so every web worker shares entries. The backend
+    handles expiry, and size when it evicts (Redis maxmemory-policy
+    allkeys-lru); hits and misses are counted per process.
+    """
+    def __init__(self, cache, ttl: float = 24 * 3600, prefix: str = 'rag'):
+        self.cache = cache
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+
+    def get(self, key: str):
+        value = self.cache.get(f"{self.prefix}:{key}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        self.cache.set(f"{self.prefix}:{key}", value, timeout=self.ttl)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
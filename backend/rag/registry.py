@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+
+# -------------------------------
+# Process-wide models and clients
+# -------------------------------
+# Loading a SentenceTransformer or opening a Chroma client takes hundreds of
+# milliseconds, so each is created once per process and shared by every
+# request and task. The heavy imports happen on first use.
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHROMA_PATH = "chromadb_data"
+# Which rag.embedders backend computes vectors in this deployment:
+# sentence-transformers (default), onnx or onnx-int8
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "sentence-transformers")
+# Vectors of chunk texts already embedded, shared by every bot and worker
+# on the host (rag.embedcache). An empty path turns the cache off.
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE", "embedding_cache")
+EMBEDDING_CACHE_ENTRIES = int(os.getenv("RAG_EMBEDDING_CACHE_ENTRIES", "200000"))
+# Where Gemini query expansions are cached (rag.querycache): "memory" for
+# each process, "shared" for the 'shared' Django cache, or empty for no caching
+EXPANSION_CACHE = os.getenv("RAG_EXPANSION_CACHE", "memory")
+EXPANSION_CACHE_ENTRIES = int(os.getenv("RAG_EXPANSION_CACHE_ENTRIES", "10000"))
+EXPANSION_CACHE_TTL = int(os.getenv("RAG_EXPANSION_CACHE_TTL", str(24 * 3600)))
+# Chat answers reused for paraphrased questions (rag.answercache), per bot
+# and process; empty turns it off. The threshold is a cosine similarity.
+ANSWER_CACHE = os.getenv("RAG_ANSWER_CACHE", "1")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = int(os.getenv("RAG_ANSWER_CACHE_TTL", str(24 * 3600)))
+# Collections of up to VECTOR_INDEX_MAX_CHUNKS chunks are also written as
+# NumPy indexes (rag.vectorindex) under this path, which chat retrieval
+# searches instead of Chroma. An empty path turns them off.
+VECTOR_INDEX_PATH = os.getenv("RAG_VECTOR_INDEX", "vector_index")
+VECTOR_INDEX_DTYPE = os.getenv("RAG_VECTOR_INDEX_DTYPE", "float32")
+VECTOR_INDEX_MAX_CHUNKS = int(os.getenv("RAG_VECTOR_INDEX_MAX_CHUNKS", "20000"))
+
+_embedding_functions = {}
+_embedding_lock = threading.Lock()
+_embedders = {}
+_embedder_lock = threading.Lock()
+_embedding_caches = {}
+_embedding_cache_lock = threading.Lock()
+_expansion_cache = None
+_expansion_cache_lock = threading.Lock()
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+_vector_indexes = {}
+_vector_index_lock = threading.Lock()
+_clients = {}
+_client_lock = threading.Lock()
+_gemini_models = {}
+_gemini_lock = threading.Lock()
+
+def get_embedding_function(model_name: str = EMBEDDING_MODEL):
+    embedding_function = _embedding_functions.get(model_name)
+    if embedding_function is None:
+        with _embedding_lock:
+            # Another thread may have loaded it while we waited
+            embedding_function = _embedding_functions.get(model_name)
+            if embedding_function is None:
+                from chromadb.utils import embedding_functions
+                embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    model_name=model_name
+                )
+                _embedding_functions[model_name] = embedding_function
+    return embedding_function
+
+def get_embedder(backend: str = None):
+    backend = backend or EMBEDDING_BACKEND
+    embedder = _embedders.get(backend)
+    if embedder is None:
+        with _embedder_lock:
+            embedder = _embedders.get(backend)
+            if embedder is None:
+                from .embedders import BACKENDS
+                if backend not in BACKENDS:
+                    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {sorted(BACKENDS)}")
+                embedder = _embedders[backend] = BACKENDS[backend]()
+    return embedder
+
+def get_embedding_cache(path: str = None):
+    path = EMBEDDING_CACHE_PATH if path is None else path
+    if not path:
+        return None
+    cache = _embedding_caches.get(path)
+    if cache is None:
+        with _embedding_cache_lock:
+            cache = _embedding_caches.get(path)
+            if cache is None:
+                from .embedcache import EmbeddingCache
+                cache = _embedding_caches[path] = EmbeddingCache(path, EMBEDDING_CACHE_ENTRIES)
+    return cache
+
+def get_expansion_cache():
+    global _expansion_cache
+    if not EXPANSION_CACHE:
+        return None
+    if _expansion_cache is None:
+        with _expansion_cache_lock:
+            if _expansion_cache is None:
+                from .querycache import LRUCache, SharedCache
+                if EXPANSION_CACHE == "shared":
+                    from django.core.cache import caches
+                    _expansion_cache = SharedCache(caches['shared'], EXPANSION_CACHE_TTL, prefix="rag:expansion")
+                else:
+                    _expansion_cache = LRUCache(EXPANSION_CACHE_ENTRIES, EXPANSION_CACHE_TTL)
+    return _expansion_cache
+
+def get_answer_cache():
+    global _answer_cache
+    if not ANSWER_CACHE:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                from django.core.cache import caches
+                from .answercache import SemanticAnswerCache
+                # Versions live in the 'shared' cache so Celery workers can invalidate
+                _answer_cache = SemanticAnswerCache(
+                    ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_ENTRIES, ANSWER_CACHE_TTL, versions=caches['shared']
+                )
+    return _answer_cache
+
+def get_chroma_client(persist_path: str = CHROMA_PATH):
+    client = _clients.get(persist_path)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(persist_path)
+            if client is None:
+                import chromadb
+                client = _clients[persist_path] = chromadb.PersistentClient(path=persist_path)
+    return client
+
+def get_collection(collection_name: str, persist_path: str = CHROMA_PATH, model_name: str = EMBEDDING_MODEL):
+    # Vectors always come from get_embedder(). The PyTorch model is only
+    # attached as the collection's embedding function when it is the
+    # backend, so ONNX deployments never load torch.
+    if EMBEDDING_BACKEND != "sentence-transformers":
+        # Cosine, like collections created with the sentence-transformers
+        # function, so distances mean the same in every deployment
+        return get_chroma_client(persist_path).get_or_create_collection(
+            name=collection_name,
+            configuration={"hnsw": {"space": "cosine"}}
+        )
+    return get_chroma_client(persist_path).get_or_create_collection(
+        name=collection_name,
+        embedding_function=get_embedding_function(model_name)
+    )
+
+def get_retrieval_index(collection_name: str, persist_path: str = CHROMA_PATH):
+    """What to search for a collection: its NumPy index if one is built, otherwise the Chroma collection."""
+    if VECTOR_INDEX_PATH:
+        from .vectorindex import VectorIndex
+        path = os.path.join(VECTOR_INDEX_PATH, collection_name)
+        with _vector_index_lock:
+            index = _vector_indexes.get(path)
+            # Picks up rebuilds made by ingest workers
+            index = VectorIndex.load(path) if index is None else index.reload()
+            _vector_indexes[path] = index
+        if index is not None:
+            return index
+    return get_collection(collection_name, persist_path)
+
+def update_vector_index(collection):
+    """Rebuild a collection's NumPy index after ingest, or drop it once the collection outgrows it."""
+    if not VECTOR_INDEX_PATH:
+        return
+    from .vectorindex import build_index, drop_index
+    path = os.path.join(VECTOR_INDEX_PATH, collection.name)
+    if collection.count() > VECTOR_INDEX_MAX_CHUNKS:
+        drop_index(path)
+    else:
+        build_index(collection, path, VECTOR_INDEX_DTYPE)
+
+def get_gemini_model(model_name: str = "gemini-2.0-flash"):
+    model = _gemini_models.get(model_name)
+    if model is None:
+        with _gemini_lock:
+            model = _gemini_models.get(model_name)
+            if model is None:
+                from google.generativeai import GenerativeModel, configure
+                configure(api_key=os.getenv("GEMINI_API_KEY"))
+                model = _gemini_models[model_name] = GenerativeModel(model_name)
+    return model
+
+def warmup(persist_path: str = CHROMA_PATH):
+    """
+    Load the embedding model and Chroma client ahead of the first request,
+    and run one embedding so lazy weight and thread-pool setup happens now.
+    """
+    start = time.perf_counter()
+    get_chroma_client(persist_path)
+    get_embedder().embed(["warmup"])
+    logging.info(f"RAG models warmed up in {time.perf_counter() - start:.2f}s")
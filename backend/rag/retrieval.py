@@ -1,8 +1,11 @@
-import os
 import re
 import json
-from google.generativeai import GenerativeModel, configure
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from .querycache import cache_key, normalize_query
+from .registry import get_embedder, get_expansion_cache, get_gemini_model
 
 load_dotenv()
 
@@ -10,8 +13,7 @@ def generate_multi_queries(query, context, n=3):
     """
     Use Gemini to generate multiple reformulations of the user's query, considering bot context.
     """
-    configure(api_key=os.getenv("GEMINI_API_KEY"))
-    gemini_model = GenerativeModel("gemini-2.0-flash")
+    gemini_model = get_gemini_model("gemini-2.0-flash")
     prompt = f"""
 Given the following user query and bot context, generate {n} diverse, relevant reformulations (paraphrases or clarifications) that could help retrieve more comprehensive information from a knowledge base.
 Return the queries as a JSON array.
@@ -46,8 +48,7 @@ def generate_hyde_query(query, context):
     """
     Use Gemini to generate a hypothetical answer (HyDE) for the user's query, considering bot context.
     """
-    configure(api_key=os.getenv("GEMINI_API_KEY"))
-    gemini_model = GenerativeModel("gemini-2.0-flash")
+    gemini_model = get_gemini_model("gemini-2.0-flash")
     prompt = f"""
 Given the following user query and bot context, generate a detailed, plausible hypothetical answer as if you were the bot responding to the user. 
 This answer should be informative and contextually relevant, even if you are not certain of the exact facts. 
@@ -63,43 +64,162 @@ Hypothetical answer:
     hyde_answer = response.text.strip()
     return hyde_answer
 
-def retrieve(collection, query, context, top_k=5, multi_query_n=3, hyde_fallback=True, min_docs=1):
+# -------------------------------
+# Cached expansions
+# -------------------------------
+def _cached(kind, generate, query, context, scope, *params):
+    # Keyed by the bot, the normalised question and the bot context, so
+    # editing a bot's description stops its old expansions being used
+    cache = get_expansion_cache()
+    if cache is None:
+        return generate()
+    key = cache_key(kind, scope, normalize_query(query), cache_key(context), *params)
+    value = cache.get(key)
+    if value is None:
+        value = generate()
+        # A reply Gemini couldn't parse falls back to the question itself; retry it next time
+        if value and value != [query]:
+            cache.set(key, value)
+    return value
+
+def expand_query(query, context, n=3, scope=None):
+    """generate_multi_queries(), served from the expansion cache when the question was seen before."""
+    return _cached("multi-query", lambda: generate_multi_queries(query, context, n=n), query, context, scope, n)
+
+def hyde_query(query, context, scope=None):
+    """generate_hyde_query(), served from the expansion cache when the question was seen before."""
+    return _cached("hyde", lambda: generate_hyde_query(query, context), query, context, scope)
+
+# -------------------------------
+# Retrieval settings
+# -------------------------------
+# "tiered" only asks Gemini for expansions when the question alone finds
+# nothing close enough; "expand" always runs multi-query retrieval
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "tiered")
+# Cosine similarity of the best match at which a tier's results are used
+MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.55"))
+
+# -------------------------------
+# Batched vector queries
+# -------------------------------
+# Gemini expansion calls run here while the original question is looked up
+_expansion_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-expand")
+
+def query_collection(collection, queries, top_k=5, embeddings=None):
+    """
+    Embed `queries` in one batch and look all of them up with a single
+    collection.query call. Returns a list of (document, distance) per query.
+    `embeddings`, if given, are the queries' vectors and nothing is embedded.
+    """
+    if not queries:
+        return []
+    if embeddings is None:
+        embeddings = get_embedder().embed(queries)
+    results = collection.query(
+        query_embeddings=embeddings,
+        n_results=top_k,
+        include=["documents", "distances"]
+    )
+    return [list(zip(docs, distances)) for docs, distances in zip(results["documents"], results["distances"])]
+
+def best_similarity(collection, *result_sets):
+    """Cosine similarity of the closest document found, or -1.0 if there is none."""
+    distances = [distance for results in result_sets for hits in results for _, distance in hits]
+    if not distances:
+        return -1.0
+    # Chroma's "l2" is the squared distance, 2 - 2cos for normalised vectors;
+    # "cosine" and "ip" are 1 - cos
+    config = getattr(collection, "configuration_json", None) or {}
+    space = config.get("hnsw", {}).get("space", "l2")
+    return 1 - min(distances) / 2 if space == "l2" else 1 - min(distances)
+
+def merge_results(*result_sets):
+    """Documents found by any query, each once at its best distance, closest first."""
+    best = {}
+    for results in result_sets:
+        for hits in results:
+            for doc, distance in hits:
+                if doc not in best or distance < best[doc]:
+                    best[doc] = distance
+    return sorted(best, key=best.get)
+
+def retrieve(collection, query, context="", top_k=5, multi_query_n=3, hyde_fallback=True, min_docs=1,
+             mode=None, min_similarity=None, scope=None, query_embedding=None):
     """
     Retrieve documents using multi-query RAG. If not enough relevant documents are found,
     use HyDE as a fallback to generate a hypothetical answer and retrieve again.
     Returns deduplicated documents from both strategies if fallback is triggered.
+
+    In "tiered" mode (see RETRIEVAL_MODE) each step only runs when the ones
+    before found nothing with at least `min_similarity`. Expansions are
+    cached per `scope` (the bot) and normalised question. Pass
+    `query_embedding` when the question was already embedded, e.g. for the
+    answer cache, so it isn't embedded twice.
     """
-    # Multi-query retrieval
-    queries = generate_multi_queries(query, context, n=multi_query_n)
-    all_docs = []
-    for q in queries:
-        results = collection.query(
-            query_texts=[q],
-            n_results=top_k
+    if (mode or RETRIEVAL_MODE) == "tiered":
+        return retrieve_tiered(
+            collection, query, context, top_k, multi_query_n, hyde_fallback, min_docs, min_similarity, scope,
+            query_embedding
         )
-        docs = results.get('documents', [[]])[0]
-        all_docs.extend(docs)
-    seen = set()
-    deduped_docs = []
-    for doc in all_docs:
-        if doc not in seen:
-            deduped_docs.append(doc)
-            seen.add(doc)
+    return retrieve_expanded(
+        collection, query, context, top_k, multi_query_n, hyde_fallback, min_docs, scope, query_embedding
+    )
+
+def retrieve_expanded(collection, query, context="", top_k=5, multi_query_n=3, hyde_fallback=True, min_docs=1,
+                      scope=None, query_embedding=None):
+    """
+    Always expands: the original query is looked up while Gemini writes the
+    reformulations, which are then embedded and queried together in one batch.
+    """
+    expansion = _expansion_pool.submit(expand_query, query, context, multi_query_n, scope)
+    direct = query_collection(collection, [query], top_k, _embeddings(query_embedding))
+    expanded = query_collection(collection, _reformulations(expansion.result, query), top_k)
+    docs = merge_results(direct, expanded)
 
     # HyDE fallback if not enough docs
-    if hyde_fallback and len(deduped_docs) < min_docs:
-        hyde_query = generate_hyde_query(query, context)
-        hyde_results = collection.query(
-            query_texts=[hyde_query],
-            n_results=top_k
-        )
-        hyde_docs = hyde_results.get('documents', [[]])[0]
-        for doc in hyde_docs:
-            if doc not in seen:
-                deduped_docs.append(doc)
-                seen.add(doc)
+    if hyde_fallback and len(docs) < min_docs:
+        hyde = query_collection(collection, [hyde_query(query, context, scope)], top_k)
+        docs = merge_results(direct, expanded, hyde)
+
+    return docs
+
+def retrieve_tiered(collection, query, context="", top_k=5, multi_query_n=3, hyde_fallback=True, min_docs=1,
+                    min_similarity=None, scope=None, query_embedding=None):
+    """
+    Direct vector query first; multi-query expansion only if its best match
+    is below `min_similarity` (default MIN_SIMILARITY), then HyDE if still
+    below. Logs which tier answered and its best similarity, for tuning.
+    """
+    if min_similarity is None:
+        min_similarity = MIN_SIMILARITY
+
+    def confident(docs, best):
+        return len(docs) >= min_docs and best >= min_similarity
 
-    return deduped_docs
+    results = [query_collection(collection, [query], top_k, _embeddings(query_embedding))]
+    tier = "direct"
+    if not confident(merge_results(*results), best_similarity(collection, *results)):
+        tier = "multi-query"
+        reformulations = _reformulations(lambda: expand_query(query, context, multi_query_n, scope), query)
+        results.append(query_collection(collection, reformulations, top_k))
+        if hyde_fallback and not confident(merge_results(*results), best_similarity(collection, *results)):
+            tier = "hyde"
+            results.append(query_collection(collection, [hyde_query(query, context, scope)], top_k))
+    docs, best = merge_results(*results), best_similarity(collection, *results)
+    logging.info(f"Retrieval answered by the {tier} tier (best similarity {best:.3f}, threshold {min_similarity})")
+    return docs
+
+def _embeddings(query_embedding):
+    # query_collection's `embeddings` for the original question alone
+    return None if query_embedding is None else [query_embedding]
+
+def _reformulations(generate, query):
+    # New, distinct reformulations from `generate`, or none if Gemini failed
+    try:
+        return [q for q in dict.fromkeys(generate()) if isinstance(q, str) and q.strip() and q != query]
+    except Exception as e:
+        logging.warning(f"Query expansion failed, using the original query only: {e}")
+        return []
 
 # if __name__ == "__main__":
 #     # Mock collection with a .query() method
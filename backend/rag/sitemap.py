@@ -0,0 +1,158 @@
+import gzip
+import heapq
+import io
+import logging
+import xml.etree.ElementTree as ET
+from collections import deque
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+from requests import HTTPError
+
+from .fetcher import Fetcher
+
+# Token matched against robots.txt User-agent lines
+ROBOTS_AGENT = 'CrawlerBot'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# -------------------------------
+# robots.txt
+# -------------------------------
+def fetch_robots(fetcher: Fetcher, start_url: str) -> RobotFileParser:
+    """
+    Fetch and parse the site's robots.txt. A missing or unreadable file
+    allows everything, as recommended by RFC 9309 for 4xx responses.
+    """
+    robots_url = urljoin(start_url, '/robots.txt')
+    parser = RobotFileParser(robots_url)
+    try:
+        response = fetcher.fetch(robots_url, content_types=None)
+    except Exception as e:
+        logging.info(f"No usable robots.txt at {robots_url}: {e}")
+        response = None
+
+    if response is None:
+        parser.allow_all = True
+    else:
+        parser.parse(response['text'].splitlines())
+    return parser
+
+def robots_delay(parser: RobotFileParser):
+    """Seconds between requests asked for by Crawl-delay or Request-rate, if any."""
+    delay = parser.crawl_delay(ROBOTS_AGENT)
+    rate = parser.request_rate(ROBOTS_AGENT)
+    if rate and rate.requests:
+        delay = max(delay or 0, rate.seconds / rate.requests)
+    return float(delay) if delay else None
+
+# -------------------------------
+# Sitemaps
+# -------------------------------
+def parse_lastmod(value: str) -> float:
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except (ValueError, OverflowError, OSError):
+        return 0.0
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def iter_sitemap(fileobj):
+    """
+    Stream (kind, loc, lastmod) entries out of a sitemap or sitemap index,
+    where kind is 'url' or 'sitemap'. Elements are discarded as soon as they
+    are read, so memory stays flat on 50k-URL sitemaps.
+    """
+    root = None
+    depth = 0
+    loc, lastmod = None, 0.0
+    for event, elem in ET.iterparse(fileobj, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        # Only direct children of <url>/<sitemap> count, so extension tags
+        # such as <image:loc> can't shadow the page's own <loc>.
+        tag = _local_name(elem.tag)
+        if depth == 3 and tag == 'loc':
+            loc = (elem.text or '').strip()
+        elif depth == 3 and tag == 'lastmod':
+            lastmod = parse_lastmod(elem.text or '')
+        elif depth == 2 and tag in ('url', 'sitemap'):
+            if loc:
+                yield tag, loc, lastmod
+            loc, lastmod = None, 0.0
+            root.clear()
+        depth -= 1
+
+def _sitemap_body(response):
+    # .xml.gz sitemaps are gzip files in their own right, on top of any
+    # Content-Encoding the server applied (which urllib3 already undid).
+    body = io.BufferedReader(response.raw)
+    if body.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=body)
+    return body
+
+def discover_sitemap_urls(
+    fetcher: Fetcher,
+    sitemap_urls: list,
+    netloc: str,
+    max_urls: int = 1000,
+    max_sitemaps: int = 20
+) -> list:
+    """
+    Walk sitemaps (following sitemap indexes) and return up to `max_urls`
+    page URLs on `netloc`, most recently modified first. URLs without a
+    lastmod keep their sitemap order after the dated ones.
+    """
+    newest = []  # min-heap of (lastmod, -seq, loc) holding the best max_urls
+    pending = deque(sitemap_urls)
+    seen = set()
+    seq = 0
+    while pending and len(seen) < max_sitemaps:
+        sitemap_url = pending.popleft()
+        if sitemap_url in seen:
+            continue
+        seen.add(sitemap_url)
+        try:
+            with fetcher.stream(sitemap_url) as response:
+                for kind, loc, lastmod in iter_sitemap(_sitemap_body(response)):
+                    if kind == 'sitemap':
+                        pending.append(loc)
+                        continue
+                    if urlparse(loc).netloc != netloc:
+                        continue
+                    item = (lastmod, -seq, loc)
+                    seq += 1
+                    if len(newest) < max_urls:
+                        heapq.heappush(newest, item)
+                    else:
+                        heapq.heappushpop(newest, item)
+        except HTTPError as e:
+            logging.info(f"No sitemap at {sitemap_url}: {e}")
+        except Exception as e:
+            logging.warning(f"Could not read sitemap {sitemap_url}: {e}")
+
+    return [loc for _, _, loc in sorted(newest, reverse=True)]
+
+# -------------------------------
+# Combined site hints for the crawler
+# -------------------------------
+def load_site_hints(fetcher: Fetcher, start_url: str, max_urls: int = 1000, use_sitemaps: bool = True) -> dict:
+    """
+    Read robots.txt and the sitemaps it lists (or /sitemap.xml when it lists
+    none). Returns {'robots', 'delay', 'seeds'} for the crawler.
+    """
+    robots = fetch_robots(fetcher, start_url)
+    seeds = []
+    if use_sitemaps:
+        sitemap_urls = robots.site_maps() or [urljoin(start_url, '/sitemap.xml')]
+        seeds = discover_sitemap_urls(fetcher, sitemap_urls, urlparse(start_url).netloc, max_urls=max_urls)
+        logging.info(f"Seeded {len(seeds)} URLs from sitemaps")
+    return {
+        'robots': robots,
+        'delay': robots_delay(robots),
+        'seeds': seeds
+    }
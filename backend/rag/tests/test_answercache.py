@@ -0,0 +1,60 @@
+import numpy as np
+from django.core.cache.backends.locmem import LocMemCache
+from rag import answercache
+from rag.answercache import SemanticAnswerCache
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+HOURS = unit(1, 0, 0)
+OPEN = unit(0.99, 0.1, 0)      # cosine ~0.995 to HOURS
+REFUNDS = unit(0.7, 0.7, 0)    # cosine ~0.71 to HOURS
+
+
+def test_paraphrases_within_the_threshold_get_the_cached_answer():
+    cache = SemanticAnswerCache(threshold=0.95)
+    assert cache.lookup(1, HOURS) is None
+    cache.store(1, HOURS, "9 to 5", True)
+    assert cache.lookup(1, OPEN) == ("9 to 5", True)
+    assert cache.lookup(1, REFUNDS) is None
+    assert cache.lookup(2, OPEN) is None
+    assert cache.stats() == {
+        "bots": 2, "entries": 1, "hits": 1, "misses": 3, "hit_rate": 0.25, "invalidations": 0
+    }
+
+
+def test_invalidation_reaches_caches_in_other_processes():
+    versions = LocMemCache("answercache-test", {})
+    web, worker = SemanticAnswerCache(versions=versions), SemanticAnswerCache(versions=versions)
+    web.store(1, HOURS, "9 to 5", True)
+    web.store(2, HOURS, "Always open", False)
+    worker.invalidate(1)
+    assert web.lookup(1, HOURS) is None
+    assert web.lookup(2, HOURS) == ("Always open", False)
+    web.store(1, HOURS, "8 to 6", True)
+    assert web.lookup(1, HOURS) == ("8 to 6", True)
+
+
+def test_expired_and_oldest_answers_are_dropped(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answercache.time, "monotonic", lambda: now[0])
+    cache = SemanticAnswerCache(max_entries=2, ttl=60)
+    cache.store(1, unit(1, 0, 0), "a", False)
+    cache.store(1, unit(0, 1, 0), "b", False)
+    cache.store(1, unit(0, 0, 1), "c", False)
+    assert cache.lookup(1, unit(1, 0, 0)) is None
+    assert cache.lookup(1, unit(0, 1, 0)) == ("b", False)
+    now[0] += 60
+    assert cache.lookup(1, unit(0, 0, 1)) is None
+
+
+def test_unreachable_versions_make_lookups_miss_instead_of_failing():
+    from django.core.cache.backends.redis import RedisCache
+    cache = SemanticAnswerCache(versions=RedisCache("redis://127.0.0.1:1/0", {}))
+    cache.store(1, HOURS, "9 to 5", True)
+    assert cache.lookup(1, HOURS) is None
+    cache.invalidate(1)
+    assert cache.stats()["entries"] == 0 and cache.stats()["misses"] == 1
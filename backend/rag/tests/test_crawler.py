@@ -0,0 +1,146 @@
+import asyncio
+import time
+from contextlib import closing
+from rag.crawler import AsyncCrawler, iter_crawl
+from rag.dedup import NearDuplicateFilter
+
+HTML = {"Content-Type": "text/html"}
+
+
+def page_requests(routes):
+    with routes.lock:
+        return [r for r in routes.requests if r[0] not in ("/robots.txt", "/sitemap.xml")]
+
+
+def crawl(base, **kwargs):
+    crawler = AsyncCrawler(base + "/", **{"delay": 0, **kwargs})
+    asyncio.run(crawler.run())
+    return crawler
+
+
+def test_budget_counts_pages_in_flight(site, add_tree):
+    base, routes = site
+    add_tree(routes)
+    crawler = crawl(base, max_pages=5, concurrency=8)
+    assert len(crawler.pages) == 5
+    assert len(page_requests(routes)) == 5
+
+
+def test_links_deeper_than_max_depth_are_not_followed(site, add_tree):
+    base, routes = site
+    add_tree(routes)
+    crawler = crawl(base, max_pages=None, max_depth=1)
+    assert sorted(crawler.pages) == sorted([base + "/"] + [f"{base}/p{n}" for n in range(8)])
+
+
+def test_robots_rules_and_crawl_delay_are_honoured(site, add_tree):
+    base, routes = site
+    routes["/robots.txt"] = (200, {"Content-Type": "text/plain"}, "User-agent: *\nDisallow: /p1\nCrawl-delay: 1\n")
+    add_tree(routes, children=3, grandchildren=0)
+    crawler = crawl(base, max_pages=None, per_host_concurrency=4)
+    assert f"{base}/p1" not in crawler.pages and len(crawler.pages) == 3
+    starts = sorted(started for _, started, _ in page_requests(routes))
+    assert "/p1" not in [path for path, _, _ in page_requests(routes)]
+    assert all(later - earlier >= 0.95 for earlier, later in zip(starts, starts[1:]))
+
+
+def test_requests_per_host_are_capped_and_spaced(site, add_tree):
+    base, routes = site
+    add_tree(routes, children=8, grandchildren=0)
+    routes.latency = 0.2
+    crawl(base, max_pages=None, concurrency=8, per_host_concurrency=2, delay=0.05)
+    requests = page_requests(routes)
+    events = sorted([(started, 1) for _, started, _ in requests] + [(finished, -1) for _, _, finished in requests])
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    assert peak == 2
+    starts = sorted(started for _, started, _ in requests)
+    assert all(later - earlier >= 0.04 for earlier, later in zip(starts, starts[1:]))
+
+
+def recrawl(base, manifest, **kwargs):
+    return crawl(base, manifest=manifest, **kwargs)
+
+
+def test_a_budget_limited_recrawl_only_removes_pages_that_are_gone(site, add_tree):
+    base, routes = site
+    add_tree(routes, children=19, grandchildren=0)
+    manifest = crawl(base, max_pages=None).pages
+    assert len(manifest) == 20
+    routes["/p5"] = (404, HTML, "")
+    crawler = recrawl(base, manifest, max_pages=10)
+    assert not crawler.exhausted
+    assert crawler.removed_urls() == {f"{base}/p5"}
+
+
+def test_a_complete_recrawl_also_removes_pages_no_longer_linked(site, add_tree, html):
+    base, routes = site
+    add_tree(routes, children=4, grandchildren=0)
+    manifest = crawl(base, max_pages=None).pages
+    routes["/"] = (200, HTML, html("Home", "/p0", "/p1", "/p2"))
+    routes["/p2"] = (410, HTML, "")
+    crawler = recrawl(base, manifest, max_pages=None)
+    assert crawler.exhausted
+    assert crawler.removed_urls() == {f"{base}/p2", f"{base}/p3"}
+
+
+def test_iter_crawl_holds_at_most_buffer_pages_for_a_slow_consumer(site, add_tree):
+    base, routes = site
+    add_tree(routes, children=19, grandchildren=0)
+    crawler = AsyncCrawler(base + "/", max_pages=None, delay=0, concurrency=2)
+    pages = iter_crawl(crawler, buffer_pages=2)
+    seen = [next(pages)["url"]]
+    time.sleep(0.5)
+    # One page consumed, two buffered, and one more held by each worker
+    assert crawler.pages_scraped <= 1 + 2 + 2
+    seen += [page["url"] for page in pages]
+    assert len(seen) == len(set(seen)) == 20
+
+
+def crawl_and_filter(base, manifest=None):
+    """Crawl through a NearDuplicateFilter; returns the crawler and the URLs embedded."""
+    crawler = AsyncCrawler(base + "/", manifest=manifest, delay=0, concurrency=1)
+    with closing(iter_crawl(crawler)) as pages:
+        embedded = [page["url"] for page in NearDuplicateFilter().filter_pages(pages, on_duplicate=crawler.recheck)
+                    if page["records"]]
+    return crawler, embedded
+
+
+def listing_site(routes, html):
+    listing = " ".join(f"item{n} costs {n * 7} pounds" for n in range(60))
+    routes["/"] = (200, HTML, html("Home", "/list", "/list-sorted"))
+    routes["/list"] = (200, HTML, f"<h1>List</h1><p>{listing}</p>")
+    routes["/list-sorted"] = (200, HTML, f"<h1>List</h1><p>{listing} sorted</p>")
+    return listing
+
+
+def test_dropped_near_duplicates_are_checked_again_on_the_next_recrawl(site, html):
+    base, routes = site
+    listing_site(routes, html)
+    crawler, embedded = crawl_and_filter(base)
+    assert embedded == [base + "/", f"{base}/list"]
+    assert crawler.pages[f"{base}/list-sorted"]["content_hash"] == ""
+
+    # The original goes away: the copy is fetched as changed and embedded
+    routes.pop("/list")
+    crawler, embedded = crawl_and_filter(base, crawler.pages)
+    assert embedded == [f"{base}/list-sorted"]
+
+
+def test_near_duplicates_of_unchanged_pages_stay_dropped_across_recrawls(site, html):
+    base, routes = site
+    listing = listing_site(routes, html)
+    crawler, _ = crawl_and_filter(base)
+    for _ in range(2):
+        # Nothing changed: the copy is checked again, against the original's stored fingerprint
+        crawler, embedded = crawl_and_filter(base, crawler.pages)
+        assert embedded == []
+        assert crawler.pages[f"{base}/list"]["simhash"] is not None
+
+    # A page that becomes a copy of an unchanged page is caught too
+    routes["/"] = (200, HTML, html("Home", "/list", "/list-sorted", "/list-by-price"))
+    routes["/list-by-price"] = (200, HTML, f"<h1>List</h1><p>{listing} by price</p>")
+    crawler, embedded = crawl_and_filter(base, crawler.pages)
+    assert embedded == [base + "/"]
@@ -0,0 +1,56 @@
+import random
+from rag.dedup import NearDuplicateFilter, hamming, simhash
+
+WORDS = "book price stock travel mystery poetry history science fiction romance fantasy music art".split()
+
+
+def listing(rng, n=300):
+    return " ".join(rng.choice(WORDS) + str(rng.randint(0, 500)) for _ in range(n))
+
+
+def test_small_edits_stay_within_a_few_bits():
+    rng = random.Random(1)
+    text = listing(rng, 1000)
+    edited = text + " page 2 of 50"
+    assert hamming(simhash(text), simhash(edited)) <= 3
+    assert hamming(simhash(text), simhash(listing(rng))) > 10
+
+
+def test_short_pages_are_never_duplicates():
+    dedup = NearDuplicateFilter()
+    assert simhash("Contact us") is None
+    assert dedup.check("http://x/a", "Contact us") is None
+    assert dedup.check("http://x/b", "Contact us") is None
+
+
+def test_filter_pages_empties_near_duplicates():
+    rng = random.Random(2)
+    text = listing(rng)
+    pages = [
+        {"url": "http://x/list", "changed": True, "records": [{"text": text}]},
+        {"url": "http://x/list?sort=asc", "changed": True, "records": [{"text": text + " sorted"}]},
+        {"url": "http://x/other", "changed": True, "records": [{"text": listing(rng)}]},
+        {"url": "http://x/same", "changed": False, "records": []},
+    ]
+    dedup = NearDuplicateFilter()
+    dropped = []
+    out = list(dedup.filter_pages(pages, on_duplicate=dropped.append))
+    assert [page["url"] for page in out] == [page["url"] for page in pages]
+    assert dropped == ["http://x/list?sort=asc"]
+    assert out[1]["records"] == [] and out[1]["duplicate_of"] == "http://x/list"
+    assert out[2]["records"] == pages[2]["records"]
+    assert dedup.stats() == {"checked": 3, "duplicates": 1, "duplicate_rate": 1 / 3}
+
+
+def test_filter_records_drops_whole_pages():
+    rng = random.Random(3)
+    first, second = listing(rng, 150), listing(rng, 150)
+    records = [
+        {"url": "http://x/a", "text": first},
+        {"url": "http://x/a", "text": second},
+        {"url": "http://x/b", "text": first},
+        {"url": "http://x/b", "text": second},
+        {"url": "http://x/c", "text": listing(rng)},
+    ]
+    kept = list(NearDuplicateFilter().filter_records(records))
+    assert [record["url"] for record in kept] == ["http://x/a", "http://x/a", "http://x/c"]
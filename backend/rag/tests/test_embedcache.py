@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from rag.embedcache import CachedEmbedder, EmbeddingCache, cache_key
+
+
+class CountingEmbedder:
+    """Deterministic 8-d vectors derived from the text, counting model calls."""
+    name = "counting"
+
+    def __init__(self, model_id="counting/v1"):
+        self.model_id = model_id
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded += texts
+        return np.array([np.random.default_rng(sum(map(ord, text))).random(8) for text in texts], dtype=np.float32)
+
+
+def test_only_unseen_texts_reach_the_model(tmp_path):
+    embedder = CountingEmbedder()
+    with EmbeddingCache(str(tmp_path)) as cache:
+        first = cache.embed(["a", "b", "a"], embedder)
+        assert embedder.embedded == ["a", "b"]
+        np.testing.assert_array_equal(first[0], first[2])
+
+        second = CachedEmbedder(embedder, cache).embed(["b", "c", "a"])
+        assert embedder.embedded == ["a", "b", "c"]
+        np.testing.assert_array_equal(second, CountingEmbedder().embed(["b", "c", "a"]))
+        assert cache.stats() == {
+            "entries": 3, "max_entries": 100_000, "hits": 3, "misses": 3, "hit_rate": 0.5, "evictions": 0
+        }
+
+
+def test_vectors_persist_and_are_keyed_by_model(tmp_path):
+    with EmbeddingCache(str(tmp_path)) as cache:
+        cache.embed(["shipping policy"], CountingEmbedder())
+    with EmbeddingCache(str(tmp_path)) as cache:
+        same_model, other_model = CountingEmbedder(), CountingEmbedder("counting/v2")
+        cache.embed(["shipping policy"], same_model)
+        cache.embed(["shipping policy"], other_model)
+        assert same_model.embedded == [] and other_model.embedded == ["shipping policy"]
+        with pytest.raises(ValueError):
+            cache.put_many([cache_key("wide", "x")], np.zeros((1, 16)))
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path):
+    embedder = CountingEmbedder()
+    with EmbeddingCache(str(tmp_path), max_entries=10) as cache:
+        cache.embed([f"t{n}" for n in range(10)], embedder)
+        cache.embed(["t0"], embedder)  # now the most recently used
+        cache.embed(["new"], embedder)
+        assert len(cache) == 10 and cache.stats()["evictions"] == 1
+
+        embedder.embedded.clear()
+        vectors = cache.embed(["t0", "t1", "new"], embedder)
+        assert embedder.embedded == ["t1"]
+        np.testing.assert_array_equal(vectors, CountingEmbedder().embed(["t0", "t1", "new"]))
+        assert len(cache) == 10
+
+
+def test_a_reused_slot_reads_as_a_miss(tmp_path):
+    with EmbeddingCache(str(tmp_path)) as cache:
+        cache.embed(["a"], CountingEmbedder())
+        key = cache_key("counting/v1", "a")
+        cache._records["key"][0] = cache_key("counting/v1", "someone else")
+        assert cache.get_many([key]) == {}
+        assert len(cache) == 0
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+import pytest
+from rag.embedders import EmbeddingPool, OnnxEmbedder, mean_pool
+
+WORDS = "[PAD] [UNK] shipping order return refund account price book store delivery".split()
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    """A word-lookup-plus-projection 'encoder' with the MiniLM export's input and output names."""
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper, numpy_helper
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    tokenizer = Tokenizer(models.WordLevel({word: i for i, word in enumerate(WORDS)}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / "tokenizer.json"))
+
+    rng = np.random.default_rng(0)
+    table = rng.normal(size=(len(WORDS), 64)).astype(np.float32)
+    projection = rng.normal(size=(64, 64)).astype(np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("Gather", ["table", "input_ids"], ["tokens"]),
+            helper.make_node("MatMul", ["tokens", "projection"], ["last_hidden_state"]),
+        ],
+        "tiny",
+        [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "seq"])],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "seq", 64])],
+        initializer=[numpy_helper.from_array(table, "table"), numpy_helper.from_array(projection, "projection")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(tmp_path / "model.onnx"))
+    return tmp_path, table @ projection
+
+
+def test_mean_pool_ignores_padding():
+    hidden = np.array([[[0.0, 0.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+    pooled = mean_pool(hidden, np.array([[1, 1, 0]]))
+    np.testing.assert_allclose(pooled, [[0.6, 0.8]], rtol=1e-6)
+
+
+def test_onnx_vectors_do_not_depend_on_batching(tiny_model):
+    model_dir, hidden = tiny_model
+    embedder = OnnxEmbedder(str(model_dir), batch_size=2)
+    texts = ["book", "shipping order return refund", "price store", "account delivery book book"]
+    batched = embedder.embed(texts)
+    assert batched.shape == (4, 64) and batched.dtype == np.float32
+    one_by_one = np.concatenate([embedder.embed([text]) for text in texts])
+    np.testing.assert_allclose(batched, one_by_one, atol=1e-5)
+
+    expected = hidden[[WORDS.index(word) for word in texts[1].split()]].mean(axis=0)
+    np.testing.assert_allclose(batched[1], expected / np.linalg.norm(expected), atol=1e-5)
+
+
+def test_int8_vectors_stay_close_to_float(tiny_model):
+    model_dir, _ = tiny_model
+    texts = ["book", "shipping order return refund", "price store", "account delivery book book"]
+    full = OnnxEmbedder(str(model_dir)).embed(texts)
+    quantized = OnnxEmbedder(str(model_dir), quantized=True).embed(texts)
+    assert os.path.exists(model_dir / "model_int8.onnx")
+    assert (full * quantized).sum(axis=1).min() > 0.99
+
+
+def test_pool_returns_every_batch_in_order(tiny_model):
+    model_dir, _ = tiny_model
+    embedder = OnnxEmbedder(str(model_dir))
+    words = WORDS[2:]
+    batches = [([f"{n}_{i}" for i in range(n % 3 + 1)], [" ".join(words[n % 7:]) for _ in range(n % 3 + 1)], None) for n in range(12)]
+    has_shm = os.path.isdir("/dev/shm")
+    shm_before = set(os.listdir("/dev/shm")) if has_shm else None
+    with EmbeddingPool(processes=2, embedder=embedder) as pool:
+        assert pool.dim == 64
+        results = [(batch, vectors.copy()) for batch, vectors in pool.embed_batches(batches, lookahead=3)]
+    assert [batch for batch, _ in results] == batches
+    for (ids, texts, _), vectors in results:
+        np.testing.assert_allclose(vectors, embedder.embed(texts), atol=1e-5)
+    if has_shm:
+        assert set(os.listdir("/dev/shm")) <= shm_before
+
+
+def test_onnx_backends_match_sentence_transformers():
+    """
+    The real model against the vectors already in the collections. Needs
+    sentence-transformers installed and the ONNX export downloadable.
+    """
+    pytest.importorskip("sentence_transformers")
+    from rag.embedders import SentenceTransformerEmbedder
+    texts = [
+        "How long does shipping take to Canada?",
+        "Refunds are issued to the original payment card within five business days.",
+        "A Light in the Attic is a poetry collection by Shel Silverstein. " * 20,
+    ]
+    reference = SentenceTransformerEmbedder().embed(texts)
+    try:
+        onnx_vectors = OnnxEmbedder().embed(texts)
+    except Exception as e:
+        pytest.skip(f"ONNX model unavailable: {e}")
+    assert (reference * onnx_vectors).sum(axis=1).min() > 0.999
+
+    pytest.importorskip("onnx")
+    int8_vectors = OnnxEmbedder(quantized=True).embed(texts)
+    similarity = (reference * int8_vectors).sum(axis=1)
+    assert similarity.min() > 0.95 and similarity.mean() > 0.98
@@ -0,0 +1,211 @@
+import random
+import pytest
+from rag import embeddings
+
+WORDS = "the shipping order return refund account price book store delivery customer support".split()
+
+
+def reference_chunks(tok, text, max_tokens, overlap_tokens):
+    # The original per-sentence implementation
+    def count(sentence):
+        return len(tok.encode(sentence, add_special_tokens=False))
+
+    chunks, current, current_len = [], [], 0
+    for sentence in embeddings.split_into_sentences(text):
+        sentence_len = count(sentence)
+        if current_len + sentence_len > max_tokens:
+            if current:
+                chunks.append(" ".join(current))
+            overlap, overlap_len = [], 0
+            if overlap_tokens > 0:
+                for s in reversed(current):
+                    if overlap_len + count(s) <= overlap_tokens:
+                        overlap.insert(0, s)
+                        overlap_len += count(s)
+                    else:
+                        break
+            current = overlap
+            current_len = sum(count(s) for s in current)
+        current.append(sentence)
+        current_len += sentence_len
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def random_document(rng):
+    sentences = []
+    for _ in range(rng.randint(0, 60)):
+        words = [rng.choice(WORDS + ["refunds", "x9", "naïve", "e-mail"]) for _ in range(rng.randint(1, 30))]
+        sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+    return rng.choice(["", "  "]) + rng.choice([" ", "\n", "  \t"]).join(sentences) + rng.choice(["", " Trailing"])
+
+
+@pytest.mark.parametrize("max_tokens,overlap_tokens", [(400, 80), (40, 10), (15, 0), (10, 30)])
+def test_chunks_match_per_sentence_tokenization(tokenizer, max_tokens, overlap_tokens):
+    rng = random.Random(max_tokens)
+    texts = [random_document(rng) for _ in range(40)] + ["", "   ", "One.", "A. B. C."]
+    batched = embeddings.chunk_texts(texts, max_tokens, overlap_tokens)
+    for text, chunks in zip(texts, batched):
+        assert chunks == reference_chunks(tokenizer, text, max_tokens, overlap_tokens)
+        assert embeddings.chunk_text(text, max_tokens, overlap_tokens) == chunks
+
+
+def test_long_documents_are_not_truncated(tokenizer):
+    tokenizer.backend_tokenizer.enable_truncation(16)
+    embeddings._offsets_tokenizer = embeddings._untruncated(tokenizer.backend_tokenizer)
+    text = "The store. " * 300
+    assert embeddings.count_tokens(text) == 900
+    assert len(embeddings.chunk_text(text, max_tokens=30, overlap_tokens=0)) == 30
+
+
+def test_chunk_ids_come_from_page_section_and_text(tokenizer):
+    records = [
+        {"url": "http://x/a", "section_title": "A", "text": "The store. The price."},
+        {"url": "http://x/b", "section_title": "B", "text": "Refund."},
+        {"url": "http://x/a", "section_title": "C", "text": "Delivery."},
+        {"url": "http://x/a", "section_title": "C", "text": "Delivery."},
+    ]
+    ids = [chunk_id for chunk_id, _, _ in embeddings.iter_chunks(records)]
+    assert ids[:3] == [
+        embeddings.chunk_id("http://x/a", "A", "The store. The price."),
+        embeddings.chunk_id("http://x/b", "B", "Refund."),
+        embeddings.chunk_id("http://x/a", "C", "Delivery."),
+    ]
+    assert ids[3] == ids[2] + "-2"
+    # Discovery order doesn't matter
+    assert [chunk_id for chunk_id, _, _ in embeddings.iter_chunks(records[1:2])] == ids[1:2]
+
+
+@pytest.fixture
+def collection(tmp_path, hash_embedder):
+    import chromadb
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).get_or_create_collection("sync_test")
+    collection.embedder = hash_embedder
+    return collection
+
+
+def page(url, *sections, changed=True):
+    return {"url": url, "changed": changed, "records": [
+        {"url": url, "section_title": title, "text": text} for title, text in sections
+    ]}
+
+
+def test_resyncing_a_page_only_writes_what_changed(tokenizer, collection):
+    pages = [
+        page("http://x/a", ("Intro", "The store."), ("Price", "The price.")),
+        page("http://x/b", ("Refund", "Refund.")),
+    ]
+    assert embeddings.embed_pages(pages, collection, batch_size=2) == 3
+
+    collection.embedder.embedded.clear()
+    recrawl = [
+        page("http://x/b", ("Refund", "Refund.")),
+        page("http://x/a", ("Price", "The price."), ("Delivery", "Delivery.")),
+    ]
+    assert embeddings.embed_pages(recrawl, collection) == 1
+    assert collection.embedder.embedded == ["Delivery."]
+    stored = collection.get()
+    assert sorted(stored["documents"]) == ["Delivery.", "Refund.", "The price."]
+    # The price section moved up the page: its metadata follows, its vector stays
+    price = stored["metadatas"][stored["documents"].index("The price.")]
+    assert price["doc_id"] == embeddings.page_doc_id("http://x/a", 0)
+
+
+def test_a_page_emptied_by_dedup_loses_its_chunks(tokenizer, collection):
+    embeddings.embed_pages([page("http://x/a", ("A", "The store.")), page("http://x/b", ("B", "Refund."))], collection)
+    committed = []
+    embeddings.embed_pages([page("http://x/a"), page("http://x/b", changed=False)], collection, on_commit=committed.extend)
+    assert collection.get()["documents"] == ["Refund."]
+    assert committed == ["http://x/a", "http://x/b"]
+
+
+def test_records_of_a_url_split_across_the_input_are_all_kept(tokenizer, collection):
+    records = [
+        {"url": "http://x/a", "section_title": "A", "text": "The store."},
+        {"url": "http://x/b", "section_title": "B", "text": "Refund."},
+        {"url": "http://x/a", "section_title": "C", "text": "Delivery."},
+    ]
+    embeddings.add_chunks_from_dicts(collection, records, batch_size=1)
+    embeddings.add_chunks_from_dicts(collection, records, batch_size=1)
+    assert sorted(collection.get()["documents"]) == ["Delivery.", "Refund.", "The store."]
+
+
+def test_csv_exports_stream_through_the_dict_path(tokenizer, collection, tmp_path, monkeypatch):
+    monkeypatch.setattr(embeddings, "get_collection", lambda name, persist_path: collection)
+    long_text = "The store. " * 20000  # one field past the csv module's default limit
+    path = tmp_path / "export.csv"
+    path.write_text(
+        '"url","section_title","h_level","text"\n'
+        '"http://x/a","Intro","1","The store. The price."\n'
+        '"http://x/a","Empty","2",""\n'
+        f'"http://x/b","Long","1","{long_text}"\n'
+    )
+    embeddings.create_embeddings_from_csv_file(str(path))
+    first = collection.get()["ids"]
+    assert {m["url"] for m in collection.get()["metadatas"]} == {"http://x/a", "http://x/b"}
+
+    collection.embedder.embedded.clear()
+    with open(path, "rb") as f:
+        embeddings.create_embeddings_from_csv_file(f)
+    assert collection.embedder.embedded == [] and collection.get()["ids"] == first
+
+    with pytest.raises(ValueError):
+        embeddings.create_embeddings_from_csv('"url","section_title","h_level","text"\n"http://x/c","A","1",""\n')
+
+
+def test_crawled_pages_are_embedded_while_the_crawl_runs(tokenizer, collection, site, add_tree):
+    from contextlib import closing
+    from rag.crawler import AsyncCrawler, iter_crawl
+    base, routes = site
+    add_tree(routes, children=6, grandchildren=0)
+    routes.latency = 0.1
+    fetched_at_commit = []
+
+    def on_commit(urls):
+        fetched_at_commit.append(len(routes.paths()))
+
+    crawler = AsyncCrawler(base + "/", delay=0, concurrency=1, per_host_concurrency=1)
+    with closing(iter_crawl(crawler)) as pages:
+        written = embeddings.embed_pages(pages, collection, batch_size=1, on_commit=on_commit)
+    assert written == 7 and collection.count() == 7
+    # The first pages were stored before most of the site had been requested
+    assert fetched_at_commit[0] < len(routes.paths()) - 3
+
+
+def test_a_resumed_crawl_neither_repeats_nor_loses_pages(tokenizer, collection, site, add_tree):
+    import json
+    from contextlib import closing
+    from rag.crawler import AsyncCrawler, iter_crawl
+    base, routes = site
+    add_tree(routes, children=11, grandchildren=0)
+
+    def killed_after(pages, n):
+        for count, page in enumerate(pages):
+            if count == n:
+                raise RuntimeError("worker lost")
+            yield page
+
+    # Two flushes of two pages are stored and acked; the fifth page was
+    # fetched and chunked but not written when the worker died
+    crawler = AsyncCrawler(base + "/", delay=0, concurrency=2)
+    acked = []
+
+    def commit(urls):
+        acked.extend(urls)
+        crawler.ack(urls)
+
+    with pytest.raises(RuntimeError), closing(iter_crawl(crawler)) as pages:
+        embeddings.embed_pages(killed_after(pages, 5), collection, batch_size=2, on_commit=commit)
+    assert len(acked) == 4 and collection.count() == 4
+    snapshot = json.loads(json.dumps(crawler.snapshot()))
+
+    fetched_before = len(routes.paths())
+    crawler = AsyncCrawler(base + "/", delay=0, concurrency=2, resume=snapshot)
+    with closing(iter_crawl(crawler)) as pages:
+        embeddings.embed_pages(pages, collection, batch_size=2, on_commit=crawler.ack)
+    refetched = [base + path for path in routes.paths()[fetched_before:] if path not in ("/robots.txt", "/sitemap.xml")]
+    assert not set(refetched) & set(acked)
+    assert sorted(set(refetched) | set(acked)) == sorted([base + "/"] + [f"{base}/p{n}" for n in range(11)])
+    embedded = collection.embedder.embedded
+    assert len(embedded) == len(set(embedded)) == collection.count() == 12
@@ -0,0 +1,61 @@
+import random
+import pytest
+from rag.bench import legacy_extract, synthetic_page
+from rag.extraction import BACKENDS, extract
+
+BASE = "https://example.com/docs/"
+
+PAGES = [
+    '<html><body>a<!-- c -->x<b>b</b>&nbsp;y<p>p<script>s</script>tail</p></body></html>',
+    '<html><body><nav><a href="/n">n</a></nav><div><a href="ok">ok</a> <a>no href</a> <a href="">empty</a></div></body></html>',
+    '<?xml version="1.0" encoding="utf-8"?><html><body><p>café ☃</p></body></html>',
+    '<html><body><template><a href="/t">tpl</a></template><ruby>漢<rt>kan</rt></ruby><header>H</header>after</body></html>',
+    '<html><body><ul><li>one<li>two</ul><div>foo<footer>gone</footer>bar</div></body></html>',
+    '<html><body></body></html>',
+]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+@pytest.mark.parametrize("html", PAGES)
+def test_backends_match_legacy_extraction(backend, html):
+    page = extract(html, BASE, backend=backend)
+    assert {"text": page["text"], "links": page["links"]} == legacy_extract(html, BASE)
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_backends_match_legacy_on_synthetic_pages(backend):
+    rng = random.Random(1)
+    for _ in range(5):
+        html = synthetic_page(rng)
+        page = extract(html, BASE, backend=backend)
+        assert {"text": page["text"], "links": page["links"]} == legacy_extract(html, BASE)
+
+
+def test_extract_text_and_links():
+    page = extract('<html><body><nav><a href="/skip">Menu</a></nav><p>Hello <a href="a#x">there</a></p></body></html>', BASE)
+    assert page["text"] == "Hello there"
+    assert page["links"] == ["https://example.com/docs/a#x"]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_sections_follow_headings(backend):
+    html = (
+        "<html><body><header><h1>Site</h1></header><p>Intro text.</p>"
+        "<section><h1>Shipping <small>(EU)</small></h1><div><p>Ships in 2 days.</p>"
+        "<h2>Returns</h2><ul><li>30 days</li><li>Free</li></ul></div></section>"
+        "<h3></h3><p>Trailing</p></body></html>"
+    )
+    assert extract(html, BASE, backend=backend)["sections"] == [
+        {"section_title": "No Section Title", "h_level": 0, "text": "Intro text."},
+        {"section_title": "Shipping (EU)", "h_level": 1, "text": "Ships in 2 days."},
+        {"section_title": "Returns", "h_level": 2, "text": "30 days Free"},
+        {"section_title": "Untitled", "h_level": 3, "text": "Trailing"},
+    ]
+
+
+def test_sections_scale_linearly():
+    # The old splitter rescanned every following sibling per heading
+    flat = "<html><body>" + "<h2>T</h2><p>word</p>" * 5000 + "</body></html>"
+    sections = extract(flat, BASE)["sections"]
+    assert len(sections) == 5000
+    assert sections[-1] == {"section_title": "T", "h_level": 2, "text": "word"}
@@ -0,0 +1,63 @@
+import pytest
+from requests import HTTPError
+from rag.fetcher import Fetcher
+
+HTML = {"Content-Type": "text/html; charset=utf-8"}
+
+
+def test_fetch_html(site):
+    base, routes = site
+    routes["/"] = (200, HTML, "<html><body>café</body></html>")
+    with Fetcher() as fetcher:
+        page = fetcher.fetch(base + "/")
+    assert page["status"] == 200
+    assert page["content_type"] == "text/html"
+    assert "café" in page["text"]
+
+
+def test_fetch_defaults_to_utf8_without_charset(site):
+    base, routes = site
+    routes["/"] = (200, {"Content-Type": "text/html"}, "<p>naïve</p>")
+    with Fetcher() as fetcher:
+        assert "naïve" in fetcher.fetch(base + "/")["text"]
+
+
+def test_fetch_decodes_gzip(site):
+    base, routes = site
+    routes["/"] = (200, {**HTML, "Content-Encoding": "gzip"}, "<p>compressed</p>")
+    with Fetcher() as fetcher:
+        assert fetcher.fetch(base + "/")["text"] == "<p>compressed</p>"
+
+
+def test_fetch_skips_unwanted_content_type(site):
+    base, routes = site
+    routes["/doc.pdf"] = (200, {"Content-Type": "application/pdf"}, b"%PDF-1.4")
+    with Fetcher() as fetcher:
+        assert fetcher.fetch(base + "/doc.pdf") is None
+        assert fetcher.fetch(base + "/doc.pdf", content_types=None) is not None
+
+
+def test_fetch_enforces_byte_cap(site):
+    base, routes = site
+    routes["/big"] = (200, HTML, "x" * 2048)
+    routes["/big.gz"] = (200, {**HTML, "Content-Encoding": "gzip"}, "x" * 2048)
+    with Fetcher(max_bytes=1024) as fetcher:
+        assert fetcher.fetch(base + "/big") is None
+        # Compressed size is tiny, but the decoded body is still over the cap
+        assert fetcher.fetch(base + "/big.gz") is None
+
+
+def test_fetch_raises_for_http_errors(site):
+    base, routes = site
+    with Fetcher() as fetcher:
+        with pytest.raises(HTTPError):
+            fetcher.fetch(base + "/missing")
+
+
+def test_fetch_returns_not_modified(site):
+    base, routes = site
+    routes["/"] = (304, {"ETag": '"v1"'}, b"")
+    with Fetcher() as fetcher:
+        page = fetcher.fetch(base + "/", headers={"If-None-Match": '"v1"'})
+    assert page["status"] == 304
+    assert page["text"] == ""
@@ -0,0 +1,74 @@
+import json
+from django.core.cache.backends.locmem import LocMemCache
+from rag.frontier import Frontier, SharedSeenSet, url_priority
+
+
+def drain(frontier):
+    items = []
+    while (item := frontier.pop()) is not None:
+        items.append(item)
+    return items
+
+
+def test_urls_are_queued_once():
+    frontier = Frontier()
+    assert frontier.push("http://x/a", 1)
+    assert not frontier.push("http://x/a", 2)
+    assert frontier.push("http://x/b", 1)
+    drain(frontier)
+    # Popped URLs stay seen
+    assert not frontier.push("http://x/a", 3)
+
+    stats = frontier.stats()
+    assert stats == {"queued": 0, "seen": 2, "duplicates": 2, "duplicate_rate": 0.5}
+
+
+def test_key_overrides_the_dedup_identity():
+    frontier = Frontier()
+    frontier.push("http://x/?utm=1", 0, key="http://x/")
+    assert not frontier.push("http://x/", 1)
+    assert drain(frontier) == [("http://x/?utm=1", 0)]
+
+
+def test_pops_by_depth_then_priority_then_insertion_order():
+    frontier = Frontier()
+    frontier.push("http://x/deep", 2)
+    frontier.push("http://x/catalogue/page-2.html", 1)
+    frontier.push("http://x/first", 1)
+    frontier.push("http://x/from-sitemap", 1, from_sitemap=True)
+    frontier.push("http://x/second", 1)
+    frontier.push("http://x/", 0)
+    assert [url for url, _ in drain(frontier)] == [
+        "http://x/",
+        "http://x/from-sitemap",
+        "http://x/first",
+        "http://x/second",
+        "http://x/catalogue/page-2.html",
+        "http://x/deep",
+    ]
+
+
+def test_low_value_urls_stay_within_their_depth():
+    assert url_priority("http://x/tag/sale/", 1) < url_priority("http://x/product", 2)
+    assert url_priority("http://x/blog/2024/05/", 1) > url_priority("http://x/blog/post", 1)
+
+
+def test_snapshot_round_trips_through_json():
+    frontier = Frontier()
+    for n in range(5):
+        frontier.push(f"http://x/{n}", n % 2)
+    frontier.pop()
+
+    restored = Frontier.restore(json.loads(json.dumps(frontier.snapshot())))
+    assert not restored.push("http://x/0", 0)
+    assert drain(restored) == drain(frontier)
+
+
+def test_shared_seen_set_hands_each_url_to_one_claimant():
+    cache = LocMemCache("frontier-test", {})
+    first = SharedSeenSet(cache, "crawl:1:a")
+    second = SharedSeenSet(cache, "crawl:1:a")
+    assert first.claim(["http://x/a", "http://x/b", "http://x/a"]) == ["http://x/a", "http://x/b"]
+    assert second.claim(["http://x/b", "http://x/c"]) == ["http://x/c"]
+    # Another crawl run starts from an empty set
+    assert SharedSeenSet(cache, "crawl:1:b").claim(["http://x/a"]) == ["http://x/a"]
@@ -0,0 +1,30 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parents[2]
+HEAVY_MODULES = ["transformers", "torch", "sentence_transformers", "chromadb", "google.generativeai", "pandas"]
+# Importing the web and task modules used to load transformers and the
+# tokenizer; without them it takes well under a second.
+IMPORT_BUDGET_SECONDS = 3.0
+
+SCRIPT = f"""
+import json, os, sys, time
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+start = time.perf_counter()
+import django
+django.setup()
+import user.views, user.tasks, rag.crawler, rag.embeddings, rag.retrieval
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+
+def test_app_import_skips_ml_libraries_and_fits_budget():
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=BACKEND, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report["loaded"] == []
+    assert report["elapsed"] < IMPORT_BUDGET_SECONDS
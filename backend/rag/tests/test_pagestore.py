@@ -0,0 +1,65 @@
+import os
+import pytest
+from rag.pagestore import CODECS, PageStore
+
+HTML = "<html><body><h1>Café</h1><p>" + "text " * 2000 + "</p></body></html>"
+
+
+@pytest.mark.parametrize("codec", sorted(CODECS))
+def test_round_trip_and_compression(tmp_path, codec):
+    with PageStore(str(tmp_path), codec=codec) as store:
+        store.append("http://x/a", HTML, {"ETag": '"1"', "Set-Cookie": "secret"})
+        page = store.get("http://x/a")
+    assert page["text"] == HTML
+    assert page["headers"] == {"ETag": '"1"'}
+    assert os.path.getsize(tmp_path / "pages.dat") < len(HTML) / 10
+
+
+def test_latest_record_wins_and_survives_reopening(tmp_path):
+    with PageStore(str(tmp_path)) as store:
+        store.append("http://x/a", "old")
+        store.append("http://x/b", "b")
+        store.append("http://x/a", "new")
+    with PageStore(str(tmp_path)) as store:
+        assert len(store) == 2
+        assert [page["text"] for page in store.iter_pages()] == ["b", "new"]
+
+
+def test_forget_and_compact(tmp_path):
+    with PageStore(str(tmp_path)) as store:
+        store.append("http://x/a", "a" * 1000)
+        store.append("http://x/a", "a" * 999)
+        store.append("http://x/b", "b")
+        store.forget(["http://x/b", "http://x/unknown"])
+        assert "http://x/b" not in store
+        size = os.path.getsize(tmp_path / "pages.dat")
+        store.compact()
+        assert os.path.getsize(tmp_path / "pages.dat") < size
+        assert store.urls() == ["http://x/a"]
+        assert store.get("http://x/a")["text"] == "a" * 999
+        store.append("http://x/c", "c")
+    with PageStore(str(tmp_path)) as store:
+        assert sorted(store.urls()) == ["http://x/a", "http://x/c"]
+
+
+def test_torn_writes_are_ignored(tmp_path):
+    with PageStore(str(tmp_path)) as store:
+        store.append("http://x/a", "a")
+    # Index line written without its data, then a half-written index line
+    with open(tmp_path / "pages.idx", "ab") as index:
+        index.write(b'{"url": "http://x/b", "offset": 999, "length": 10, "codec": "zlib"}\n{"url": "http://x/c", "off')
+    with PageStore(str(tmp_path)) as store:
+        assert store.urls() == ["http://x/a"]
+        store.append("http://x/d", "d")
+    with PageStore(str(tmp_path)) as store:
+        assert store.urls() == ["http://x/a", "http://x/d"]
+        assert store.get("http://x/d")["text"] == "d"
+
+
+def test_headers_are_kept_whatever_their_case(tmp_path):
+    from rag.crawler import replay_pages
+    with PageStore(str(tmp_path)) as store:
+        store.append("http://x/a", HTML, {"etag": '"2"', "last-modified": "Tue, 01 Oct 2024 10:00:00 GMT"})
+        assert store.get("http://x/a")["headers"] == {"ETag": '"2"', "Last-Modified": "Tue, 01 Oct 2024 10:00:00 GMT"}
+        page, = replay_pages(store)
+    assert (page["etag"], page["last_modified"]) == ('"2"', "Tue, 01 Oct 2024 10:00:00 GMT")
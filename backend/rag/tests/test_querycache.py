@@ -0,0 +1,43 @@
+from django.core.cache.backends.locmem import LocMemCache
+from rag import querycache
+from rag.querycache import LRUCache, SharedCache, cache_key, normalize_query
+
+
+def test_questions_differing_in_case_spacing_and_punctuation_share_a_key():
+    assert normalize_query("  What are your\n hours?? ") == normalize_query("what are your hours")
+    assert cache_key(1, normalize_query("Hours?")) != cache_key(2, normalize_query("Hours?"))
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats() == {
+        "entries": 2, "hits": 3, "misses": 1, "hit_rate": 0.75, "evictions": 1, "expirations": 0
+    }
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(querycache.time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl=60)
+    cache.set("a", ["x"])
+    now[0] += 59
+    assert cache.get("a") == ["x"]
+    now[0] += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0 and cache.stats()["expirations"] == 1
+
+
+def test_shared_cache_prefixes_keys_and_counts_lookups():
+    backend = LocMemCache("querycache-test", {})
+    cache = SharedCache(backend, ttl=60, prefix="rag:test")
+    assert cache.get("k") is None
+    cache.set("k", ["a", "b"])
+    assert cache.get("k") == ["a", "b"]
+    assert backend.get("rag:test:k") == ["a", "b"]
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
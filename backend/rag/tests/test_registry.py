@@ -0,0 +1,40 @@
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from chromadb.utils import embedding_functions
+from rag import registry
+
+
+class SlowModel:
+    loads = 0
+
+    def __init__(self, model_name):
+        time.sleep(0.05)
+        SlowModel.loads += 1
+        self.model_name = model_name
+
+
+def test_each_model_loads_once_across_threads(monkeypatch):
+    monkeypatch.setattr(embedding_functions, "SentenceTransformerEmbeddingFunction", SlowModel)
+    monkeypatch.setattr(registry, "_embedding_functions", {})
+    with ThreadPoolExecutor(8) as pool:
+        models = list(pool.map(lambda _: registry.get_embedding_function("m"), range(16)))
+    assert SlowModel.loads == 1
+    assert all(model is models[0] for model in models)
+    assert registry.get_embedding_function("other").model_name == "other"
+    assert SlowModel.loads == 2
+
+
+def test_clients_are_shared_per_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry, "_clients", {})
+    first = registry.get_chroma_client(str(tmp_path / "a"))
+    assert registry.get_chroma_client(str(tmp_path / "a")) is first
+    assert registry.get_chroma_client(str(tmp_path / "b")) is not first
+
+
+def test_embedders_are_shared_per_backend(monkeypatch):
+    monkeypatch.setattr(registry, "_embedders", {})
+    assert registry.get_embedder("onnx") is registry.get_embedder("onnx")
+    assert registry.get_embedder("onnx-int8").quantized
+    with pytest.raises(ValueError):
+        registry.get_embedder("tf-idf")
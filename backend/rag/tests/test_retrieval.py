@@ -0,0 +1,130 @@
+import threading
+import chromadb
+import numpy as np
+import pytest
+from rag import retrieval
+from rag.querycache import LRUCache
+
+VECTORS = {
+    "hours": [1.0, 0.0, 0.0],
+    "when are you open": [0.9, 0.1, 0.0],
+    "opening times": [0.8, 0.2, 0.0],
+    "refunds": [0.0, 1.0, 0.0],
+    "shipping": [0.0, 0.0, 1.0],
+    "hmm": [0.6, 0.0, 0.8],
+    "  HMM? ": [0.6, 0.0, 0.8],
+    "hmmm": [0.0, 0.6, 0.8],
+    "a guess about hours": [0.98, 0.0, 0.199],
+}
+
+
+class TableEmbedder:
+    def embed(self, texts):
+        return np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+
+class CountingCollection:
+    def __init__(self, collection):
+        self.collection = collection
+        self.queries = []
+
+    def query(self, query_embeddings, **kwargs):
+        self.queries.append(len(query_embeddings))
+        return self.collection.query(query_embeddings=query_embeddings, **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def expansion_cache(monkeypatch):
+    cache = LRUCache()
+    monkeypatch.setattr(retrieval, "get_expansion_cache", lambda: cache)
+    return cache
+
+
+@pytest.fixture
+def collection(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "get_embedder", lambda: TableEmbedder())
+    collection = chromadb.PersistentClient(path=str(tmp_path)).get_or_create_collection("retrieval_test")
+    docs = {"We open 9 to 5.": "hours", "Refunds take 5 days.": "refunds", "We ship worldwide.": "shipping"}
+    collection.add(ids=list(docs.values()), documents=list(docs), embeddings=[VECTORS[v] for v in docs.values()])
+    return CountingCollection(collection)
+
+
+def test_reformulations_are_queried_in_one_batch_while_expansion_runs(collection, monkeypatch):
+    released = threading.Event()
+
+    def slow_expansion(query, context, n=3):
+        # Only finishes once the original question has been looked up
+        assert released.wait(5)
+        return ["when are you open", "opening times", query]
+
+    def query_then_release(query_embeddings, **kwargs):
+        result = CountingCollection.query(collection, query_embeddings, **kwargs)
+        released.set()
+        return result
+
+    monkeypatch.setattr(retrieval, "generate_multi_queries", slow_expansion)
+    monkeypatch.setattr(collection, "query", query_then_release)
+    docs = retrieval.retrieve(collection, "hours", "A shop", top_k=2, hyde_fallback=False, mode="expand")
+    assert collection.queries == [1, 2]
+    assert docs[0] == "We open 9 to 5."
+    assert len(docs) == len(set(docs))
+
+
+def test_failed_expansion_falls_back_to_the_original_query(collection, monkeypatch):
+    def broken(query, context, n=3):
+        raise RuntimeError("quota exceeded")
+
+    monkeypatch.setattr(retrieval, "generate_multi_queries", broken)
+    assert retrieval.retrieve(collection, "refunds", top_k=1, hyde_fallback=False, mode="expand") == ["Refunds take 5 days."]
+    assert collection.queries == [1]
+
+
+def test_merge_keeps_each_document_at_its_best_distance():
+    merged = retrieval.merge_results([[("a", 0.5), ("b", 0.6)]], [[("b", 0.1)], [("c", 0.7), ("a", 0.9)]])
+    assert merged == ["b", "a", "c"]
+
+
+@pytest.mark.parametrize("reformulations,tier,queries", [
+    (None, "direct", [1]),
+    (["hmmm", "hours"], "multi-query", [1, 2]),
+    (["hmmm"], "hyde", [1, 1, 1]),
+])
+def test_tiers_escalate_only_below_the_threshold(collection, monkeypatch, caplog, reformulations, tier, queries):
+    calls = []
+    monkeypatch.setattr(retrieval, "generate_multi_queries", lambda q, c, n=3: calls.append("expand") or reformulations)
+    monkeypatch.setattr(retrieval, "generate_hyde_query", lambda q, c: calls.append("hyde") or "a guess about hours")
+    caplog.set_level("INFO")
+    query = "hours" if tier == "direct" else "hmm"
+    docs = retrieval.retrieve(collection, query, top_k=1, mode="tiered", min_similarity=0.9)
+    assert docs[0] == "We open 9 to 5."
+    assert collection.queries == queries
+    assert calls == {"direct": [], "multi-query": ["expand"], "hyde": ["expand", "hyde"]}[tier]
+    assert f"answered by the {tier} tier" in caplog.text
+
+
+def test_expansions_are_cached_per_bot_and_normalised_question(collection, monkeypatch, expansion_cache):
+    calls = []
+    monkeypatch.setattr(retrieval, "generate_multi_queries", lambda q, c, n=3: calls.append(q) or ["hmmm", "hours"])
+    for query, scope in [("hmm", 1), ("  HMM? ", 1), ("hmm", 2)]:
+        docs = retrieval.retrieve(collection, query, "A shop", top_k=1, hyde_fallback=False, min_similarity=0.9,
+                                  scope=scope)
+        assert docs[0] == "We open 9 to 5."
+    assert calls == ["hmm", "hmm"]
+    assert expansion_cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("mode", ["tiered", "expand"])
+def test_a_precomputed_question_vector_is_not_embedded_again(collection, monkeypatch, mode):
+    embedded = []
+
+    class RecordingEmbedder(TableEmbedder):
+        def embed(self, texts):
+            embedded.extend(texts)
+            return super().embed(texts)
+
+    monkeypatch.setattr(retrieval, "get_embedder", lambda: RecordingEmbedder())
+    monkeypatch.setattr(retrieval, "generate_multi_queries", lambda q, c, n=3: ["when are you open"])
+    vector = np.array(VECTORS["hours"], dtype=np.float32)
+    docs = retrieval.retrieve(collection, "hours", top_k=1, hyde_fallback=False, mode=mode, query_embedding=vector)
+    assert docs[0] == "We open 9 to 5."
+    assert "hours" not in embedded
@@ -0,0 +1,66 @@
+import gzip
+import io
+from rag.fetcher import Fetcher
+from rag.sitemap import discover_sitemap_urls, iter_sitemap, load_site_hints
+
+XML = {"Content-Type": "application/xml"}
+
+URLSET = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"
+        xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">
+  <url><loc>{base}/old</loc><lastmod>2020-01-01</lastmod></url>
+  <url>
+    <loc>{base}/new</loc><lastmod>2024-05-01T10:00:00+00:00</lastmod>
+    <image:image><image:loc>{base}/img.png</image:loc></image:image>
+  </url>
+  <url><loc>{base}/undated</loc></url>
+  <url><loc>https://elsewhere.example/page</loc></url>
+</urlset>"""
+
+INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>{base}/pages.xml.gz</loc></sitemap>
+</sitemapindex>"""
+
+
+def test_iter_sitemap_ignores_extension_locs():
+    entries = list(iter_sitemap(io.BytesIO(URLSET.format(base="http://x").encode())))
+    assert [loc for _, loc, _ in entries] == [
+        "http://x/old", "http://x/new", "http://x/undated", "https://elsewhere.example/page",
+    ]
+    assert all(kind == "url" for kind, _, _ in entries)
+
+
+def test_discover_orders_by_lastmod_and_follows_index(site):
+    base, routes = site
+    routes["/sitemap.xml"] = (200, XML, INDEX.format(base=base))
+    routes["/pages.xml.gz"] = (200, {"Content-Type": "application/x-gzip"}, gzip.compress(URLSET.format(base=base).encode()))
+    netloc = base.split("//")[1]
+    with Fetcher() as fetcher:
+        urls = discover_sitemap_urls(fetcher, [base + "/sitemap.xml"], netloc)
+        assert urls == [base + "/new", base + "/old", base + "/undated"]
+        assert discover_sitemap_urls(fetcher, [base + "/sitemap.xml"], netloc, max_urls=1) == [base + "/new"]
+
+
+def test_site_hints_from_robots(site):
+    base, routes = site
+    routes["/robots.txt"] = (200, {"Content-Type": "text/plain"}, (
+        "User-agent: *\nDisallow: /private\nCrawl-delay: 2\n"
+        f"Sitemap: {base}/pages.xml\n"
+    ))
+    routes["/pages.xml"] = (200, XML, URLSET.format(base=base))
+    with Fetcher() as fetcher:
+        hints = load_site_hints(fetcher, base + "/")
+    assert hints["delay"] == 2.0
+    assert hints["seeds"][0] == base + "/new"
+    assert not hints["robots"].can_fetch("CrawlerBot", base + "/private/page")
+    assert hints["robots"].can_fetch("CrawlerBot", base + "/new")
+
+
+def test_site_hints_without_robots_or_sitemap(site):
+    base, _ = site
+    with Fetcher() as fetcher:
+        hints = load_site_hints(fetcher, base + "/")
+    assert hints["delay"] is None
+    assert hints["seeds"] == []
+    assert hints["robots"].can_fetch("CrawlerBot", base + "/anything")
@@ -0,0 +1,56 @@
+import chromadb
+import numpy as np
+import pytest
+from rag import registry
+from rag.vectorindex import VectorIndex, build_index, drop_index
+
+
+@pytest.fixture
+def collection(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).get_or_create_collection(
+        "index_test", configuration={"hnsw": {"space": "cosine"}}
+    )
+    collection.add(
+        ids=[f"c{n}" for n in range(300)], documents=[f"chunk {n}" for n in range(300)], embeddings=vectors
+    )
+    return collection
+
+
+@pytest.mark.parametrize("dtype,tolerance", [("float32", 1e-5), ("float16", 2e-3)])
+def test_results_match_the_chroma_collection(collection, tmp_path, dtype, tolerance):
+    index = build_index(collection, str(tmp_path / "index"), dtype, batch_size=128)
+    assert index.count() == 300 and index.vectors.dtype == dtype
+    assert isinstance(index.vectors, np.memmap)
+    queries = np.random.default_rng(1).normal(size=(3, 16))
+    expected = collection.query(query_embeddings=queries, n_results=5, include=["documents", "distances"])
+    found = index.query(queries, n_results=5)
+    assert found["ids"] == expected["ids"]
+    assert found["documents"] == expected["documents"]
+    np.testing.assert_allclose(found["distances"], expected["distances"], atol=tolerance)
+    assert index.query(queries[:1], n_results=1000)["ids"][0][-1] != found["ids"][0][0]
+
+
+def test_readers_pick_up_rebuilds_and_keep_their_mapping(collection, tmp_path):
+    path = str(tmp_path / "index")
+    assert VectorIndex.load(path) is None
+    old = build_index(collection, path)
+    assert old.reload() is old
+    collection.delete(ids=["c0"])
+    build_index(collection, path)
+    new = old.reload()
+    assert new.count() == 299 and "c0" not in new.ids
+    assert old.query(np.ones(16), n_results=300)["ids"][0].count("c0") == 1
+    drop_index(path)
+    assert new.reload() is None
+
+
+def test_small_collections_are_searched_through_their_index(collection, monkeypatch, vector_index_path):
+    registry.update_vector_index(collection)
+    assert isinstance(registry.get_retrieval_index("index_test"), VectorIndex)
+    monkeypatch.setattr(registry, "VECTOR_INDEX_MAX_CHUNKS", 100)
+    monkeypatch.setattr(registry, "get_collection", lambda name, persist_path: collection)
+    registry.update_vector_index(collection)
+    assert registry.get_retrieval_index("index_test") is collection
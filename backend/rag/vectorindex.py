@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import time
+import numpy as np
+
+# -------------------------------
+# Brute-force NumPy vector index
+# -------------------------------
+BLOCK_ROWS = 8192  # float16 rows converted to float32 at a time while scoring
+
+class VectorIndex:
+    """
+    A collection's chunks as one contiguous (n, dim) matrix of unit
+    vectors, searched by a matrix product and argpartition. For the few
+    thousand chunks most bots have, that beats Chroma's HNSW and SQLite
+    round-trips. query() takes and returns what Collection.query does, so
+    retrieve() can search either.
+
+    An index is a directory written by build_index():
+
+        current              the version readers should open
+        vectors-<v>.npy      float32 or float16 matrix, memory-mapped
+        documents-<v>.json   ids and documents, in matrix row order
+
+    Every process maps the same file, so the vectors sit in the page cache
+    once however many web workers there are. A rebuild writes a new
+    version and swaps `current`; open indexes keep their old files.
+    """
+    # Distances are 1 - cosine similarity, as in a cosine-space collection
+    configuration_json = {"hnsw": {"space": "cosine"}}
+
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.vectors = np.load(os.path.join(path, f"vectors-{version}.npy"), mmap_mode='r')
+        with open(os.path.join(path, f"documents-{version}.json"), encoding='utf-8') as f:
+            stored = json.load(f)
+        self.ids, self.documents = stored['ids'], stored['documents']
+        self.name = os.path.basename(os.path.normpath(path))
+
+    @classmethod
+    def load(cls, path: str):
+        """The current version of the index at `path`, or None if there is none."""
+        version = _current_version(path)
+        if version is None:
+            return None
+        try:
+            return cls(path, version)
+        except FileNotFoundError:
+            # Removed by a rebuild or drop_index() since `current` was read
+            return None
+
+    def reload(self):
+        """This index, or its newer version if it was rebuilt (None if it was dropped)."""
+        if _current_version(self.path) == self.version:
+            return self
+        return VectorIndex.load(self.path)
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        if self.vectors.dtype == np.float32:
+            return queries @ self.vectors.T
+        # NumPy has no fast float16 matmul: widen a block of rows at a time
+        scores = np.empty((len(queries), len(self.vectors)), dtype=np.float32)
+        for start in range(0, len(self.vectors), BLOCK_ROWS):
+            block = self.vectors[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + len(block)] = queries @ block.T
+        return scores
+
+    def query(self, query_embeddings, n_results: int = 10, include=("documents", "distances")) -> dict:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        k = min(n_results, self.count())
+        if k == 0:
+            top = np.zeros((len(queries), 0), dtype=np.int64)
+            similarities = np.zeros((len(queries), 0), dtype=np.float32)
+        else:
+            scores = self._scores(queries)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            similarities = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-similarities, axis=1, kind='stable')
+            top = np.take_along_axis(top, order, axis=1)
+            similarities = np.take_along_axis(similarities, order, axis=1)
+        results = {'ids': [[self.ids[i] for i in row] for row in top]}
+        if "documents" in include:
+            results['documents'] = [[self.documents[i] for i in row] for row in top]
+        if "distances" in include:
+            results['distances'] = (1 - similarities).tolist()
+        return results
+
+def _current_version(path: str):
+    try:
+        with open(os.path.join(path, 'current'), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _remove_version(path: str, version: str):
+    for name in (f"vectors-{version}.npy", f"documents-{version}.json"):
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+def build_index(collection, path: str, dtype: str = 'float32', batch_size: int = 5000) -> VectorIndex:
+    """Write the chunks of a Chroma collection as a new version of the index at `path`."""
+    start = time.perf_counter()
+    ids, documents, vectors = [], [], []
+    offset = 0
+    while True:
+        batch = collection.get(include=["embeddings", "documents"], limit=batch_size, offset=offset)
+        if not batch['ids']:
+            break
+        ids += batch['ids']
+        documents += batch['documents']
+        vectors.append(np.asarray(batch['embeddings'], dtype=np.float32))
+        offset += len(batch['ids'])
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    # Unit rows make the matrix product the cosine similarity
+    matrix /= np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+    os.makedirs(path, exist_ok=True)
+    previous = _current_version(path)
+    version = f"{time.time_ns()}-{os.getpid()}"
+    np.save(os.path.join(path, f"vectors-{version}.npy"), matrix.astype(dtype))
+    with open(os.path.join(path, f"documents-{version}.json"), 'w', encoding='utf-8') as f:
+        json.dump({'ids': ids, 'documents': documents}, f)
+    tmp_path = os.path.join(path, f"current.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(path, 'current'))
+    if previous is not None:
+        _remove_version(path, previous)
+    logging.info(f"Built {dtype} vector index of {len(ids)} chunks at {path} in {time.perf_counter() - start:.2f}s")
+    return VectorIndex(path, version)
+
+def drop_index(path: str):
+    """Remove the index at `path`, so its collection is searched in Chroma again."""
+    version = _current_version(path)
+    if version is None:
+        return
+    os.remove(os.path.join(path, 'current'))
+    _remove_version(path, version)
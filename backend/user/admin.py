@@ -1,9 +1,11 @@
 from django.contrib import admin
-from .models import CustomUser,Conversation,Bot, Message
+from .models import CustomUser,Conversation,Bot, Message, CrawledPage, CrawlCheckpoint
 
 # Register your models here.
 
 admin.site.register(CustomUser)
 admin.site.register(Bot)
 admin.site.register(Conversation)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(CrawledPage)
+admin.site.register(CrawlCheckpoint)
\ No newline at end of file
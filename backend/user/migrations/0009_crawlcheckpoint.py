@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_crawledpage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='crawl_checkpoint', to='user.bot')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_crawlcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='crawledpage',
+            name='simhash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+    ]
@@ -61,6 +61,32 @@ class Bot(models.Model):
     def __str__(self):
         return f"{self.chatbot_name} ({self.website_url})"
 
+class CrawledPage(models.Model):
+    bot = models.ForeignKey(Bot, on_delete=models.CASCADE, related_name='pages')
+    url = models.URLField(max_length=2000)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)  # sha256 of the extracted text
+    simhash = models.CharField(max_length=16, blank=True)  # hex SimHash, for near-duplicate checks (rag.dedup)
+    links = models.JSONField(default=list, blank=True)  # same-site links, followed when the page is unchanged
+    crawled_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('bot', 'url')
+
+    def __str__(self):
+        return self.url
+
+class CrawlCheckpoint(models.Model):
+    # Frontier, seen URLs and finished pages of an interrupted crawl,
+    # as produced by AsyncCrawler.snapshot(). Removed once the crawl completes.
+    bot = models.OneToOneField(Bot, on_delete=models.CASCADE, related_name='crawl_checkpoint')
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Checkpoint for {self.bot}"
+
 class Conversation(models.Model):
     bot = models.ForeignKey('Bot', on_delete=models.CASCADE, related_name='conversations')
     customer_name = models.CharField(max_length=255, blank=True)
@@ -1,18 +1,292 @@
-from celery import shared_task
-from rag.crawler import crawl
-from rag.embeddings import create_embeddings_from_dicts
+import logging
+import os
+import time
+import uuid
+from contextlib import closing
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rag.crawler import AsyncCrawler, iter_crawl, normalize_url, replay_pages
+from rag.dedup import NearDuplicateFilter
+from rag.embeddings import delete_url_chunks, embed_pages, get_collection
+from rag.fetcher import Fetcher
+from rag.frontier import SharedSeenSet
+from rag.pagestore import PageStore
+from rag.registry import get_answer_cache, get_embedding_cache, update_vector_index
+from rag.sitemap import load_site_hints
 
-@shared_task
-def crawl_and_embed(bot_id, website_url):
-    from .models import Bot
-    bot = Bot.objects.get(id=bot_id)
-    scraped_data = crawl(website_url)
-    create_embeddings_from_dicts(
-        scraped_data,
-        collection_name=bot.collection_name or f"bot_{bot.id}_collection"
+# Save the crawl state after this many newly stored pages, or this many seconds
+CHECKPOINT_EVERY_PAGES = 25
+CHECKPOINT_EVERY_SECONDS = 30
+
+# URLs per distributed crawl subtask, and the distributed crawl's page budget
+CRAWL_BATCH_SIZE = 25
+CRAWL_MAX_PAGES = 50
+# Raw HTML of every crawled page, one store per bot, for re-embedding without refetching
+PAGE_STORE_ROOT = "page_store"
+
+def page_store_for(bot) -> PageStore:
+    return PageStore(os.path.join(PAGE_STORE_ROOT, f"bot_{bot.id}"))
+
+def log_cache_stats():
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is not None:
+        stats = embedding_cache.stats()
+        logging.info(
+            f"Embedding cache: {stats['hit_rate']:.1%} hit rate, "
+            f"{stats['entries']}/{stats['max_entries']} vectors, {stats['evictions']} evicted"
+        )
+
+def collection_updated(bot_id, collection):
+    # Chat searches the NumPy copy of small collections, and cached answers
+    # may rest on chunks that just changed
+    update_vector_index(collection)
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        answer_cache.invalidate(bot_id)
+
+def load_manifest(bot, urls=None) -> dict:
+    """The bot's previous crawl, as the manifest AsyncCrawler recrawls against."""
+    pages = bot.pages.all()
+    if urls is not None:
+        pages = pages.filter(url__in=urls)
+    return {
+        page.url: {
+            'etag': page.etag,
+            'last_modified': page.last_modified,
+            'content_hash': page.content_hash,
+            'simhash': int(page.simhash, 16) if page.simhash else None,
+            'links': page.links,
+        }
+        for page in pages
+    }
+
+def save_pages(bot, pages: dict):
+    from .models import CrawledPage
+    CrawledPage.objects.bulk_create(
+        [
+            CrawledPage(
+                bot=bot,
+                url=url,
+                etag=page['etag'],
+                last_modified=page['last_modified'],
+                content_hash=page['content_hash'],
+                simhash=format(page['simhash'], '016x') if page.get('simhash') is not None else '',
+                links=page['links'],
+            )
+            for url, page in pages.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['bot', 'url'],
+        update_fields=['etag', 'last_modified', 'content_hash', 'simhash', 'links', 'crawled_at'],
     )
+
+def remove_pages(bot, collection, urls):
+    """Delete the chunks, stored HTML and manifest rows of pages that are gone from the site."""
+    urls = list(urls)
+    if not urls:
+        return
+    delete_url_chunks(collection, urls)
+    with page_store_for(bot) as page_store:
+        page_store.forget(urls)
+    bot.pages.filter(url__in=urls).delete()
+
+def mark_active(bot, collection_name: str):
     bot.status = 'active'
     if not bot.collection_name:
-        bot.collection_name = f"bot_{bot.id}_collection"
+        bot.collection_name = collection_name
     bot.save()
-    return True
\ No newline at end of file
+
+# acks_late + reject_on_worker_lost: a worker killed mid-crawl leaves the task
+# on the broker, and the redelivered run resumes from the last checkpoint.
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def crawl_and_embed(bot_id, website_url):
+    from .models import Bot, CrawlCheckpoint
+    bot = Bot.objects.get(id=bot_id)
+    collection_name = bot.collection_name or f"bot_{bot.id}_collection"
+
+    # Recrawl against the previous manifest: unchanged pages come back as
+    # 304s or identical hashes and are not re-embedded.
+    manifest = load_manifest(bot)
+    checkpoint = CrawlCheckpoint.objects.filter(bot=bot).first()
+    resume = None
+    if checkpoint is not None and checkpoint.state.get('start_url') == website_url:
+        resume = checkpoint.state
+
+    # Pages are chunked and embedded while the crawl is still fetching
+    page_store = page_store_for(bot)
+    crawler = AsyncCrawler(website_url, manifest=manifest, resume=resume, page_store=page_store)
+    collection = get_collection(collection_name)
+    unsaved = 0
+    last_saved = time.monotonic()
+
+    def save_checkpoint(urls):
+        # Called once the pages' chunks are in the collection
+        nonlocal unsaved, last_saved
+        crawler.ack(urls)
+        unsaved += len(urls)
+        if unsaved >= CHECKPOINT_EVERY_PAGES or time.monotonic() - last_saved >= CHECKPOINT_EVERY_SECONDS:
+            CrawlCheckpoint.objects.update_or_create(
+                bot=bot, defaults={'state': {'start_url': website_url, **crawler.snapshot()}}
+            )
+            unsaved = 0
+            last_saved = time.monotonic()
+
+    # Pages that nearly duplicate an earlier one (pagination, faceted
+    # listings) are not embedded
+    duplicates = NearDuplicateFilter()
+    with page_store, closing(iter_crawl(crawler)) as pages:
+        added = embed_pages(
+            duplicates.filter_pages(pages, on_duplicate=crawler.recheck), collection, on_commit=save_checkpoint
+        )
+    logging.info(f"Skipped {duplicates.duplicates} near-duplicate pages of {duplicates.checked} changed pages")
+    log_cache_stats()
+    if not manifest and not resume and not added:
+        raise ValueError("Scraped data is empty. No data to embed.")
+
+    # Only pages that are gone, or unreached after the whole site was crawled
+    remove_pages(bot, collection, crawler.removed_urls())
+    save_pages(bot, crawler.pages)
+
+    CrawlCheckpoint.objects.filter(bot=bot).delete()
+    mark_active(bot, collection_name)
+    collection_updated(bot.id, collection)
+    return True
+
+def start_crawl(bot):
+    """Queue a crawl of the bot's site, distributed if settings.RAG_DISTRIBUTED_CRAWL is on."""
+    if settings.RAG_DISTRIBUTED_CRAWL:
+        crawl_site.delay(bot.id, bot.website_url)
+    else:
+        crawl_and_embed.delay(bot.id, bot.website_url)
+
+# -------------------------------
+# Distributed crawl
+# -------------------------------
+# The crawl runs breadth-first in waves. Each wave's URLs are split into
+# batches of CRAWL_BATCH_SIZE, crawled and embedded by parallel crawl_batch
+# subtasks, and a chord callback claims the links they found in a seen set
+# kept in the 'shared' cache, then dispatches the next wave. Per-host limits
+# (concurrency, Crawl-delay) and near-duplicate filtering apply per batch,
+# so N workers can hit one site N times as hard and there is no checkpoint
+# to resume from: it is opt-in (settings.RAG_DISTRIBUTED_CRAWL).
+
+def _dispatch_wave(bot_id, website_url, run, urls: list, dispatched: int, added: int):
+    batches = [urls[start:start + CRAWL_BATCH_SIZE] for start in range(0, len(urls), CRAWL_BATCH_SIZE)]
+    logging.info(f"Crawling {len(urls)} URLs for bot {bot_id} in {len(batches)} batches")
+    chord(
+        group(crawl_batch.s(bot_id, website_url, batch) for batch in batches),
+        crawl_wave_done.s(bot_id, website_url, run, dispatched + len(urls), added)
+    ).delay()
+
+@shared_task
+def crawl_site(bot_id, website_url, max_pages=CRAWL_MAX_PAGES):
+    """
+    Distributed counterpart of crawl_and_embed: fans the crawl out over all
+    Celery workers and marks the bot active once every wave has finished.
+    """
+    from .models import Bot
+    bot = Bot.objects.get(id=bot_id)
+    run = {
+        'id': uuid.uuid4().hex,
+        'started_at': timezone.now().isoformat(),
+        'max_pages': max_pages,
+        'recrawl': bot.pages.exists(),
+    }
+    with Fetcher() as fetcher:
+        hints = load_site_hints(fetcher, website_url, max_urls=max_pages)
+    seen = SharedSeenSet(caches['shared'], f"crawl:{bot_id}:{run['id']}")
+    seen.claim([normalize_url(website_url)])
+    urls = [[website_url, 0]] + [[url, 1] for url in seen.claim([normalize_url(seed) for seed in hints['seeds']])]
+    _dispatch_wave(bot_id, website_url, run, urls[:max_pages], 0, 0)
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def crawl_batch(bot_id, website_url, urls):
+    """
+    Crawl and embed exactly `urls` ([url, depth] pairs) without following
+    links, and delete the pages among them that answered 404/410. Returns
+    the same-site links found, one wave deeper, and the number of chunks
+    added.
+    """
+    from .models import Bot
+    bot = Bot.objects.get(id=bot_id)
+    collection = get_collection(bot.collection_name or f"bot_{bot.id}_collection")
+    crawler = AsyncCrawler(
+        website_url,
+        max_pages=None,
+        manifest=load_manifest(bot, [url for url, _ in urls]),
+        use_sitemaps=False,
+        seeds=urls,
+        follow_links=False,
+        page_store=page_store_for(bot)
+    )
+    duplicates = NearDuplicateFilter()
+    with crawler.page_store, closing(iter_crawl(crawler)) as pages:
+        added = embed_pages(duplicates.filter_pages(pages, on_duplicate=crawler.recheck), collection)
+    save_pages(bot, crawler.pages)
+    remove_pages(bot, collection, crawler.gone)
+
+    depths = {url: depth for url, depth in urls}
+    links = [
+        [link, depths[url] + 1]
+        for url, page in crawler.pages.items() if url in depths
+        for link in page['links']
+    ]
+    return {'links': links, 'added': added}
+
+@shared_task
+def crawl_wave_done(results, bot_id, website_url, run, dispatched, added):
+    from .models import Bot
+    added += sum(result['added'] for result in results)
+    budget = run['max_pages'] - dispatched
+    seen = SharedSeenSet(caches['shared'], f"crawl:{bot_id}:{run['id']}")
+    urls = []
+    if budget > 0:
+        links = [link for result in results for link in result['links']]
+        depths = {}
+        for url, depth in links:
+            depths.setdefault(url, depth)
+        urls = [[url, depths[url]] for url in seen.claim(depths)][:budget]
+    if urls:
+        _dispatch_wave(bot_id, website_url, run, urls, dispatched, added)
+        return
+
+    # Last wave. Pages that answered 404/410 were deleted by their batch.
+    # Pages of the previous crawl that weren't reached again are only gone
+    # if the waves ran out of links before the page budget ran out.
+    bot = Bot.objects.get(id=bot_id)
+    collection_name = bot.collection_name or f"bot_{bot.id}_collection"
+    if not added and not run['recrawl']:
+        raise ValueError("Scraped data is empty. No data to embed.")
+    collection = get_collection(collection_name)
+    if budget > 0:
+        unreached = bot.pages.filter(crawled_at__lt=run['started_at'])
+        remove_pages(bot, collection, unreached.values_list('url', flat=True))
+    mark_active(bot, collection_name)
+    collection_updated(bot_id, collection)
+    logging.info(f"Distributed crawl of {website_url} finished: {dispatched} URLs, {added} chunks added")
+    log_cache_stats()
+
+# -------------------------------
+# Re-embed from stored pages
+# -------------------------------
+@shared_task
+def reembed_from_store(bot_id):
+    """
+    Rebuild a bot's chunks from the raw pages kept in its page store, e.g.
+    after changing chunking or the embedding model. The site isn't fetched.
+    """
+    from .models import Bot
+    bot = Bot.objects.get(id=bot_id)
+    collection = get_collection(bot.collection_name or f"bot_{bot.id}_collection")
+    duplicates = NearDuplicateFilter()
+    dropped = []
+    with page_store_for(bot) as page_store:
+        added = embed_pages(duplicates.filter_pages(replay_pages(page_store), on_duplicate=dropped.append), collection)
+    # Recrawls must fetch and check the dropped pages again (see filter_pages)
+    bot.pages.filter(url__in=dropped).update(etag='', last_modified='', content_hash='')
+    logging.info(f"Re-embedded {added} chunks for bot {bot_id} from its page store")
+    collection_updated(bot_id, collection)
+    log_cache_stats()
+    return added
@@ -0,0 +1,83 @@
+import functools
+from urllib.parse import urlparse
+import chromadb
+import pytest
+from backend.celery import app
+from rag import registry
+from rag.crawler import AsyncCrawler
+from user import tasks
+from user.factories import BotFactory
+
+HTML = {"Content-Type": "text/html"}
+
+
+@pytest.fixture
+def crawl_env(db, site, add_tree, tokenizer, hash_embedder, tmp_path, monkeypatch, settings):
+    """Celery tasks run inline against the local site, a scratch collection and a local-memory cache."""
+    settings.CACHES = {
+        alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+        for alias in ("default", "shared")
+    }
+    monkeypatch.setattr(app.conf, "task_always_eager", True)
+    monkeypatch.setattr(app.conf, "task_eager_propagates", True)
+    collection = chromadb.PersistentClient(path=str(tmp_path / "chroma")).get_or_create_collection("tasks_test")
+    monkeypatch.setattr(tasks, "get_collection", lambda name: collection)
+    monkeypatch.setattr(registry, "EMBEDDING_CACHE_PATH", "")
+    monkeypatch.setattr(tasks, "PAGE_STORE_ROOT", str(tmp_path / "page_store"))
+    monkeypatch.setattr(tasks, "AsyncCrawler", functools.partial(AsyncCrawler, delay=0))
+    waves = []
+    dispatch = tasks._dispatch_wave
+    monkeypatch.setattr(tasks, "_dispatch_wave", lambda *args: waves.append(args[3]) or dispatch(*args))
+    base, routes = site
+    add_tree(routes, children=6)
+    bot = BotFactory(website_url=base + "/")
+    return bot, collection, base, routes, waves
+
+
+def chunk_urls(collection):
+    return {metadata["url"] for metadata in collection.get(include=["metadatas"])["metadatas"]}
+
+
+def test_waves_go_one_level_deeper_until_the_budget(crawl_env):
+    bot, collection, base, routes, waves = crawl_env
+    tasks.crawl_site.delay(bot.id, bot.website_url, max_pages=10)
+    assert [[depth for _, depth in wave] for wave in waves] == [[0], [1] * 6, [2] * 3]
+    assert bot.pages.count() == 10
+    assert chunk_urls(collection) == {url for url, _ in sum(waves, [])}
+    bot.refresh_from_db()
+    assert bot.status == "active"
+
+
+def test_a_budget_limited_recrawl_only_removes_pages_that_are_gone(crawl_env):
+    bot, collection, base, routes, waves = crawl_env
+    tasks.crawl_site.delay(bot.id, bot.website_url, max_pages=10)
+    # Which children made the last wave depends on which pages answered first
+    kept = {url for url, _ in waves[2]}
+    parent = urlparse(min(kept)).path.rsplit("/", 1)[0]
+    routes[parent] = (404, HTML, "")
+    tasks.crawl_site.delay(bot.id, bot.website_url, max_pages=10)
+    # The parent's children weren't reached this time, but nothing says they are gone
+    urls = set(bot.pages.values_list("url", flat=True))
+    assert base + parent not in urls and kept <= urls
+    assert base + parent not in chunk_urls(collection) and kept <= chunk_urls(collection)
+
+
+def test_a_complete_recrawl_removes_pages_no_longer_linked(crawl_env, html):
+    bot, collection, base, routes, waves = crawl_env
+    tasks.crawl_site.delay(bot.id, bot.website_url, max_pages=50)
+    assert bot.pages.count() == 19
+    routes["/p5"] = (200, HTML, html("Page 5"))
+    tasks.crawl_site.delay(bot.id, bot.website_url, max_pages=50)
+    assert bot.pages.count() == 17
+    assert not {f"{base}/p5/c0", f"{base}/p5/c1"} & chunk_urls(collection)
+
+
+def test_bots_are_crawled_by_one_resumable_task_unless_distributed(crawl_env, settings):
+    from user.models import CrawlCheckpoint
+    bot, collection, base, routes, waves = crawl_env
+    tasks.start_crawl(bot)
+    assert waves == [] and bot.pages.count() == 19
+    assert len(chunk_urls(collection)) == 19 and not CrawlCheckpoint.objects.filter(bot=bot).exists()
+    settings.RAG_DISTRIBUTED_CRAWL = True
+    tasks.start_crawl(bot)
+    assert len(waves) == 3
@@ -0,0 +1,73 @@
+import json
+import numpy as np
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from rag.answercache import SemanticAnswerCache
+from user import views
+from user.factories import BotFactory
+
+VECTORS = {
+    "What are your hours?": [1.0, 0.0, 0.0],
+    "When are you open?": [0.99, 0.1, 0.0],
+}
+
+
+class TableEmbedder:
+    def __init__(self):
+        self.embedded = []
+
+    def embed(self, texts):
+        self.embedded += texts
+        vectors = np.array([VECTORS[text] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class FakeGemini:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        return type("Response", (), {"text": json.dumps({"message": "We open 9 to 5.", "is_resolved": True})})
+
+
+@pytest.fixture
+def chat(db, client, monkeypatch):
+    """Post questions to chat_with_bot with retrieval and Gemini replaced; returns (ask, embedder, gemini)."""
+    embedder, gemini = TableEmbedder(), FakeGemini()
+    monkeypatch.setattr(views, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(views, "get_gemini_model", lambda name: gemini)
+    monkeypatch.setattr(views, "get_retrieval_index", lambda name: None)
+    monkeypatch.setattr(views, "retrieve", lambda *args, **kwargs: ["We open 9 to 5."])
+    bot = BotFactory(embed_code="shop", allowed_domains=["shop.example"])
+
+    def ask(message):
+        response = client.post(
+            f"/api/user/bot/{bot.embed_code}/chat/", {"message": message},
+            content_type="application/json", HTTP_ORIGIN="https://www.shop.example"
+        )
+        assert response.status_code == 200
+        return response.json()["bot_reply"]
+
+    return ask, embedder, gemini
+
+
+def test_paraphrased_questions_get_the_cached_answer(chat, monkeypatch):
+    ask, embedder, gemini = chat
+    answer_cache = SemanticAnswerCache(versions=LocMemCache("chat-test", {}))
+    monkeypatch.setattr(views, "get_answer_cache", lambda: answer_cache)
+    assert ask("What are your hours?") == "We open 9 to 5."
+    assert ask("When are you open?") == "We open 9 to 5."
+    assert len(gemini.prompts) == 1
+    # Each question is embedded once, for the cache and retrieval both
+    assert embedder.embedded == ["What are your hours?", "When are you open?"]
+
+
+def test_chat_answers_while_the_answer_cache_is_unreachable(chat, monkeypatch):
+    ask, embedder, gemini = chat
+    answer_cache = SemanticAnswerCache(versions=RedisCache("redis://127.0.0.1:1/0", {}))
+    monkeypatch.setattr(views, "get_answer_cache", lambda: answer_cache)
+    assert ask("What are your hours?") == "We open 9 to 5."
+    assert ask("When are you open?") == "We open 9 to 5."
+    assert len(gemini.prompts) == 2
@@ -7,15 +7,13 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken
 import json
+import logging
 from django.shortcuts import render
 from .models import Bot, Conversation, Message
-from .tasks import crawl_and_embed
+from .tasks import start_crawl
 from rag.retrieval import retrieve
-import chromadb
-from chromadb.utils import embedding_functions
-from google.generativeai import GenerativeModel, configure
+from rag.registry import get_answer_cache, get_embedder, get_gemini_model, get_retrieval_index
 from django.conf import settings
-import os
 from dotenv import load_dotenv
 from django.db.models import Count
 from django.db.models.functions import TruncDate
@@ -125,7 +123,7 @@ def onboarding(request):
         )
         bot.collection_name = f"bot_{bot.id}_collection"
         bot.save()
-        crawl_and_embed.delay(bot.id, bot.website_url)
+        start_crawl(bot)
         return JsonResponse({"success": True, "bot_id": bot.id, "embed_code": embed_code})  # <-- Return embed code
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -289,18 +287,45 @@ def chat_with_bot(request, embed_code):  # <-- changed from bot_id to embed_code
         text=user_message
     )
 
-    # Load ChromaDB collection for this bot
-    chroma_client = chromadb.PersistentClient(path="chromadb_data")
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"
-    )
-    collection = chroma_client.get_or_create_collection(
-        name=bot.collection_name,
-        embedding_function=sentence_transformer_ef
-    )
+    def reply(bot_reply, is_resolved):
+        # Save bot message
+        bot_msg = Message.objects.create(
+            conversation=conversation,
+            sender="bot",
+            text=bot_reply
+        )
+
+        # Update conversation's is_resolved field based on AI response
+        conversation.is_resolved = bool(is_resolved)
+        conversation.save()
+
+        return JsonResponse({
+            "bot_reply": bot_reply,
+            "is_resolved": is_resolved,
+            "conversation_id": conversation.id,
+            "created_at": conversation.created_at.strftime("%Y-%m-%d %H:%M"),
+            "bot_message_id": bot_msg.id,
+        })
 
-    # Retrieve relevant docs
-    docs = retrieve(collection, user_message)
+    # A paraphrase of a question this bot already answered gets that answer
+    answer_cache = get_answer_cache()
+    question_vector = None
+    if answer_cache is not None:
+        question_vector = get_embedder().embed([user_message])[0]
+        cached = answer_cache.lookup(bot.id, question_vector)
+        if cached is not None:
+            stats = answer_cache.stats()
+            logging.info(f"Answer cache hit for bot {bot.id} ({stats['hit_rate']:.1%} hit rate)")
+            return reply(*cached)
+
+    # The bot's NumPy vector index, or its ChromaDB collection if it has none
+    # (models, clients and indexes are loaded once per process)
+    collection = get_retrieval_index(bot.collection_name)
+
+    # Retrieve relevant docs; the business description guides query expansion
+    bot_context = f"{bot.business_name} ({bot.business_type}). Support goals: {bot.support_goals}"
+    # The question is only embedded once, here or for the answer cache above
+    docs = retrieve(collection, user_message, bot_context, scope=bot.id, query_embedding=question_vector)
     context = "\n".join(docs)
 
     # JSON structure for the AI to return
@@ -414,8 +439,7 @@ Answer as {bot.chatbot_name}:
 """
 
     # Generate answer using Gemini
-    configure(api_key=os.getenv("GEMINI_API_KEY"))
-    gemini_model = GenerativeModel("gemini-2.0-flash")
+    gemini_model = get_gemini_model("gemini-2.0-flash")
     response = gemini_model.generate_content(prompt)
     raw_text = response.text.strip()
 
@@ -438,25 +462,12 @@ Answer as {bot.chatbot_name}:
     except Exception:
         bot_reply = raw_text
         is_resolved = False
+    else:
+        # Replies that address the customer by name aren't reused for others
+        if answer_cache is not None and not (customer_name and customer_name in bot_reply):
+            answer_cache.store(bot.id, question_vector, bot_reply, is_resolved)
 
-    # Save bot message
-    bot_msg = Message.objects.create(
-        conversation=conversation,
-        sender="bot",
-        text=bot_reply
-    )
-
-    # Update conversation's is_resolved field based on AI response
-    conversation.is_resolved = bool(is_resolved)
-    conversation.save()
-
-    return JsonResponse({
-        "bot_reply": bot_reply,
-        "is_resolved": is_resolved,
-        "conversation_id": conversation.id,
-        "created_at": conversation.created_at.strftime("%Y-%m-%d %H:%M"),
-        "bot_message_id": bot_msg.id,
-    })
+    return reply(bot_reply, is_resolved)
 
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
@@ -506,7 +517,7 @@ def add_bot(request):
         )
         bot.collection_name = f"bot_{bot.id}_collection"
         bot.save()
-        crawl_and_embed.delay(bot.id, bot.website_url)
+        start_crawl(bot)
         return JsonResponse({"success": True, "bot_id": bot.id, "embed_code": embed_code})
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
@@ -567,6 +578,8 @@ def edit_bot(request, bot_id):
         user = request.user
         data = request.data
         bot = Bot.objects.get(id=bot_id, user=user)  # Ensure ownership
+        prompt_fields = ["business_name", "business_type", "chatbot_name", "tone", "support_goals", "languages"]
+        old_prompt = [getattr(bot, field) for field in prompt_fields]
 
         # Update fields if provided
         bot.website_url = data.get("websiteUrl", bot.website_url)
@@ -581,6 +594,10 @@ def edit_bot(request, bot_id):
         # Add more fields as needed
 
         bot.save()
+        # Cached chat answers were written for the old prompt
+        answer_cache = get_answer_cache()
+        if answer_cache is not None and [getattr(bot, field) for field in prompt_fields] != old_prompt:
+            answer_cache.invalidate(bot.id)
         return JsonResponse({"success": True, "bot_id": bot.id})
     except Bot.DoesNotExist:
         return JsonResponse({"error": "Bot not found or not owned by user"}, status=404)